@@ -0,0 +1,172 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+import extract
+import feature
+import plot
+import store
+import tfidf
+import weekly
+from cube import TWEET_TYPES, load_cube, merge_cubes, period_counts
+from instrument import peak_rss_mb
+from sinks import FORMATS
+
+LOG_FILE = 'batch.log'
+RESULTS_FILE = 'batch_results.json'
+
+# Archives are the tweets.js files under a directory (an export's data/ folder
+# or a folder of exports), or the paths listed in a manifest file, one per
+# line, relative to the manifest; '#' starts a comment
+def discover_archives(source):
+    if os.path.isdir(source):
+        archives = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            if 'tweets.js' in files:
+                archives.append(os.path.join(root, 'tweets.js'))
+        return archives
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', encoding='utf-8') as f:
+        lines = [line.split('#', 1)[0].strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line]
+
+# Stages write their outputs next to the archive, as the scripts do. Figures
+# render in the archive's own process: the archives are the parallelism here
+def stage_extract(input_file, options):
+    extract.extract_full_text(input_file, fmt=options['format'], batch_size=options['batch_size'])
+
+def stage_feature(input_file, options):
+    feature.extract_features(input_file, fmt=options['format'], batch_size=options['batch_size'])
+
+def stage_weekly(input_file, options):
+    weekly.main(input_file, os.path.dirname(input_file), workers=1)
+
+def stage_tfidf(input_file, options):
+    tfidf.main(input_file, os.path.join(os.path.dirname(input_file), 'tfidf.json'),
+               hashing=options['hashing'], batch_size=options['batch_size'])
+
+def stage_plot(input_file, options):
+    plot.plot_all(input_file, os.path.dirname(input_file), workers=1)
+
+STAGES = {
+    'extract': stage_extract,
+    'feature': stage_feature,
+    'weekly': stage_weekly,
+    'tfidf': stage_tfidf,
+    'plot': stage_plot,
+}
+DEFAULT_OPTIONS = {'format': 'csv', 'batch_size': 100000, 'hashing': False}
+
+# All stages on one archive, in order. A failing stage is recorded and the
+# next ones still run; the scripts' console output goes to the archive's batch.log.
+# A multi-part archive's parts are parsed one after another, as figures are rendered
+def process_archive(input_file, stages, options):
+    store.configure(part_workers=1)
+    results = {}
+    with open(os.path.join(os.path.dirname(input_file), LOG_FILE), 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        for name in stages:
+            start = time.perf_counter()
+            try:
+                STAGES[name](input_file, options)
+                results[name] = {'seconds': round(time.perf_counter() - start, 3)}
+            except Exception as e:
+                print(f"{name} failed: {type(e).__name__}: {e}")
+                results[name] = {'seconds': round(time.perf_counter() - start, 3), 'error': f'{type(e).__name__}: {e}'}
+    return {'stages': results, 'peak_rss_mb': round(peak_rss_mb(), 1)}
+
+# Each archive gets a fresh process (like bench.measure), so one that crashes
+# or is killed for memory fails alone, and its memory is returned when it ends.
+# The processes are spawned: forking this multi-threaded parent can deadlock the child
+def run_isolated(input_file, stages, options):
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(process_archive, input_file, stages, options).result()
+    except BrokenProcessPool:
+        result = {'error': 'worker process died (out of memory?)'}
+    except Exception as e:
+        result = {'error': f'{type(e).__name__}: {e}'}
+    failed = [name for name, stage in result.get('stages', {}).items() if 'error' in stage]
+    return {'archive': input_file, 'status': 'failed' if 'error' in result or failed else 'ok', 'failed_stages': failed,
+            'seconds': round(time.perf_counter() - start, 3), **result}
+
+# Up to jobs archives at a time; with the per-archive batch size this is what
+# bounds total memory. Results come back in archive order
+def run_batch(archives, stages=list(STAGES), jobs=None, options=None):
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as threads:
+        futures = {threads.submit(run_isolated, input_file, stages, options): input_file for input_file in archives}
+        for done, future in enumerate(as_completed(futures), 1):
+            result = results[futures[future]] = future.result()
+            detail = result.get('error') or ', '.join(result['failed_stages'])
+            print(f"[{done}/{len(archives)}] {result['status']:<6} {result['seconds']:8.1f}s  {result['archive']}"
+                  + (f"  ({detail})" if detail else ''))
+    return [results[input_file] for input_file in archives]
+
+# Cross-account aggregate from the archives' count cubes: weekly and monthly
+# counts summed over all accounts, and one row of totals per account
+def combined_aggregate(archives, output_dir):
+    cubes, accounts = [], []
+    for input_file in archives:
+        try:
+            cube = load_cube(input_file)
+        except Exception as e:  # an unreadable archive is left out of the aggregate
+            print(f"Skipping {input_file} in the aggregate: {type(e).__name__}: {e}")
+            continue
+        cubes.append(cube)
+        totals = cube.groupby('tweet_type')['count'].sum().reindex(TWEET_TYPES, fill_value=0)
+        accounts.append({'archive': input_file, 'first_date': cube['date'].min(), 'last_date': cube['date'].max(),
+                         **{'is_' + name: int(totals[name]) for name in TWEET_TYPES},
+                         'total_tweets': int(totals.sum())})
+    if not cubes:
+        return []
+    combined, output_files = merge_cubes(cubes), []
+    for name, freq in [('weekly', 'W'), ('monthly', 'M')]:
+        stats = period_counts(combined, freq)
+        stats['total_tweets'] = stats.sum(axis=1)
+        output_files.append(os.path.join(output_dir, f'combined_{name}_twitter_stats.csv'))
+        stats.to_csv(output_files[-1])
+    output_files.append(os.path.join(output_dir, 'combined_accounts.csv'))
+    pd.DataFrame(accounts).to_csv(output_files[-1], index=False)
+    return output_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the analysis on many accounts' archives")
+    parser.add_argument('source', help='directory searched for tweets.js files, or a manifest listing archive paths')
+    parser.add_argument('--jobs', type=int, help='archives processed at once (default: one per CPU); lower it to cap memory')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='output format of extract and feature')
+    parser.add_argument('--batch-size', type=int, default=100000, help='tweets per batch within an archive')
+    parser.add_argument('--hashing', action='store_true', help='out-of-core tfidf (see tfidf.py --hashing)')
+    parser.add_argument('--combined', action='store_true', help='also write the cross-account aggregate')
+    parser.add_argument('--output-dir', help='where the results and aggregate go (default: source directory)')
+    args = parser.parse_args()
+
+    archives = discover_archives(args.source)
+    if not archives:
+        parser.error(f"no archives found in {args.source}")
+    output_dir = args.output_dir or (args.source if os.path.isdir(args.source) else os.path.dirname(os.path.abspath(args.source)))
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = run_batch(archives, args.stages, args.jobs,
+                        {'format': args.format, 'batch_size': args.batch_size, 'hashing': args.hashing})
+    results_file = os.path.join(output_dir, RESULTS_FILE)
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    failed = [result['archive'] for result in results if result['status'] != 'ok']
+    print(f"{len(results) - len(failed)} of {len(results)} archives done; results in {results_file}")
+
+    if args.combined:
+        usable = [result['archive'] for result in results if 'error' not in result]
+        for output_file in combined_aggregate(usable, output_dir):
+            print(f"Combined aggregate saved to {output_file}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+import cloud
+import weekly
+from cube import cube_paths, hourly_counts, load_cube, period_counts, time_cells, weekday_counts
+from extract import extract_full_text
+from feature import clean_text, compact_features, compute_features, expand_features, extract_features
+from instrument import peak_rss_mb
+from loader import iter_tweets
+from sinks import FORMATS
+from store import TIMESTAMP_FORMAT, load_tweet_frame, parse_created_at
+from tfidf import analyze_tweets, analyze_tweets_hashed
+
+# Run func in a fresh worker process so peak RSS reflects that run only
+def measure(func, *args):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_timed, func, *args).result()
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    rows = func(*args)
+    return {'seconds': time.perf_counter() - start, 'rows': rows, 'peak_rss_mb': peak_rss_mb()}
+
+def load_read_replace(input_file):
+    with open(input_file, 'r', encoding='utf-8') as f:
+        tweets = json.loads(f.read().replace('window.YTD.tweets.part0 = ', ''))
+    return sum(1 for tweet in tweets if 'full_text' in tweet['tweet'])
+
+def load_streaming(input_file):
+    return sum(1 for tweet in iter_tweets(input_file) if 'full_text' in tweet['tweet'])
+
+def bench_loader(input_file):
+    size_mb = os.path.getsize(input_file) / 2**20
+    print(f"Archive: {input_file} ({size_mb:.1f} MB)")
+    for name, func in [('read+replace+json.loads', load_read_replace), ('iter_tweets', load_streaming)]:
+        r = measure(func, input_file)
+        print(f"{name:<25} {r['seconds']:8.2f}s {r['rows'] / r['seconds']:12.0f} tweets/s "
+              f"{size_mb / r['seconds']:8.1f} MB/s  peak RSS {r['peak_rss_mb']:.0f} MB")
+
+def bench_timestamps(input_file, repeat=3):
+    values = [tweet['tweet']['created_at'] for tweet in iter_tweets(input_file)]
+    timings = {}
+    for name, func in [('datetime.strptime per row', lambda: [datetime.strptime(v, TIMESTAMP_FORMAT) for v in values]),
+                       ('parse_created_at', lambda: parse_created_at(values))]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+        print(f"{name:<27} {best:8.3f}s {len(values) / best:12.0f} timestamps/s")
+    print(f"Speedup: {timings['datetime.strptime per row'] / timings['parse_created_at']:.1f}x")
+
+# Row-by-row feature.py implementation kept as the reference for compute_features
+def legacy_features(tweets):
+    features = []
+    for dt, full_text in zip(tweets['created_at'], tweets['full_text']):
+        if full_text is None:
+            continue
+        text = clean_text(full_text)
+        features.append({
+            'created_at': dt.strftime('%Y-%m-%d %H:%M'), 'year': dt.year, 'month': dt.month, 'day': dt.day,
+            'hour': dt.hour, 'minute': dt.minute, 'weekday': dt.weekday(), 'text': text,
+            'char_count': len(text), 'word_count': len(text.split()), 'mention_count': text.count('@'),
+            'hashtag_count': text.count('#'), 'url_count': text.count('http'),
+            'exclamation_count': text.count('!'), 'question_count': text.count('?'),
+            'is_retweet': 1 if text.startswith('RT @') else 0, 'is_reply': 1 if text.startswith('@') else 0,
+        })
+    df = pd.DataFrame(features)
+    df['is_weekend'] = df['weekday'].apply(lambda x: 1 if x >= 5 else 0)
+    df['day_type'] = df['weekday'].apply(lambda x: 'weekend' if x >= 5 else 'weekday')
+    df['time_category'] = pd.cut(df['hour'], bins=[-0.1, 6, 12, 18, 23.1], labels=['night', 'morning', 'afternoon', 'evening'])
+    df['season'] = pd.cut(df['month'], bins=[-0.1, 3, 6, 9, 12.1], labels=['winter', 'spring', 'summer', 'autumn'])
+    df['tweet_length_category'] = pd.cut(df['char_count'], bins=[-0.1, 20, 50, 100, 277.1], labels=['short', 'medium', 'long', 'very_long'])
+    df['tweet_type'] = df.apply(lambda row: 'retweet' if row['is_retweet'] else ('reply' if row['is_reply'] else 'original'), axis=1)
+    df['has_mention'] = df['mention_count'].apply(lambda x: 1 if x > 0 else 0)
+    df['has_hashtag'] = df['hashtag_count'].apply(lambda x: 1 if x > 0 else 0)
+    df['has_url'] = df['url_count'].apply(lambda x: 1 if x > 0 else 0)
+    df['text_without_mentions'] = df['text'].apply(lambda x: re.sub(r'@\w+', '', x).strip())
+    df['capital_letter_ratio'] = df['text'].apply(lambda x: sum(1 for c in x if c.isupper()) / len(x) if len(x) > 0 else 0)
+    df['unique_word_ratio'] = df['text'].apply(lambda x: len(set(x.split())) / len(x.split()) if len(x.split()) > 0 else 0)
+    df['mention_category'] = pd.cut(df['mention_count'], bins=[-0.1, 0, 1, 2, float('inf')], labels=['none', 'single', 'double', 'multiple'])
+    df['hashtag_category'] = pd.cut(df['hashtag_count'], bins=[-0.1, 0, 1, float('inf')], labels=['none', 'single', 'multiple'])
+    df['punctuation_intensity'] = df.apply(lambda row: 'high' if row['exclamation_count'] + row['question_count'] > 1 else 'low', axis=1)
+    df['date'] = pd.to_datetime(df['created_at']).dt.date
+    df['tweet_frequency'] = df['date'].map(df.groupby('date')['text'].count())
+    df['tweet_frequency_category'] = pd.cut(df['tweet_frequency'], bins=[0, 5, 10, float('inf')], labels=['low', 'medium', 'high'])
+    hourly_tweet_count = df.groupby('hour')['text'].count()
+    df['tweet_density'] = df['hour'].map(hourly_tweet_count)
+    df['tweet_density_category'] = pd.cut(df['tweet_density'], bins=[0, hourly_tweet_count.quantile(0.33), hourly_tweet_count.quantile(0.67), float('inf')], labels=['low', 'medium', 'high'])
+    df['engagement_score'] = df['mention_count'] + df['hashtag_count']
+    df['engagement_category'] = pd.cut(df['engagement_score'], bins=[-0.1, 0, 1, 2, float('inf')], labels=['none', 'low', 'medium', 'high'])
+    df['tweet_complexity'] = df.apply(lambda row: 'complex' if row['char_count'] > 50 and row['unique_word_ratio'] > 0.8 else 'simple', axis=1)
+    return df
+
+def compare_frames(expected, actual):
+    if list(expected.columns) != list(actual.columns):
+        raise AssertionError(f"Column mismatch: {list(expected.columns)} != {list(actual.columns)}")
+    mismatched = []
+    for column in expected.columns:
+        try:
+            pd.testing.assert_series_equal(expected[column], actual[column], check_exact=True)
+        except AssertionError:
+            mismatched.append(column)
+    if mismatched:
+        raise AssertionError(f"Columns differ from the reference: {mismatched}")
+
+def bench_features(input_file):
+    tweets = load_tweet_frame(input_file, columns=['created_at', 'full_text'])
+    timings, frames = {}, {}
+    for name, func in [('legacy_features', legacy_features), ('compute_features', compute_features)]:
+        start = time.perf_counter()
+        frames[name] = func(tweets)
+        timings[name] = time.perf_counter() - start
+        print(f"{name:<17} {timings[name]:8.2f}s {len(tweets) / timings[name]:12.0f} tweets/s")
+    compare_frames(frames['legacy_features'], frames['compute_features'])
+    print(f"All {len(frames['compute_features'].columns)} columns match. "
+          f"Speedup: {timings['legacy_features'] / timings['compute_features']:.1f}x")
+
+def bench_workers(input_file, workers=(1, 2, 4, 8, 16)):
+    tweets = load_tweet_frame(input_file, columns=['created_at', 'full_text'])
+    reference, baseline = None, None
+    for n in workers:
+        start = time.perf_counter()
+        df = compute_features(tweets, workers=n)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference, baseline = df, seconds
+        else:
+            compare_frames(reference, df)
+        print(f"--workers {n:<3} {seconds:8.2f}s {len(tweets) / seconds:12.0f} tweets/s  scaling {baseline / seconds:5.2f}x")
+    print(f"Output identical across worker counts (cpu_count={os.cpu_count()})")
+
+# Rows/sec and peak RSS of extract.py and feature.py writing to each sink, one
+# fresh process per run
+def bench_sinks(input_file, batch_size=100000):
+    rows = measure(_text_rows, input_file)['rows']
+    print(f"Archive: {input_file} ({rows} tweets with text, batch size {batch_size})")
+    for name, stage in [('extract', extract_full_text), ('feature', extract_features)]:
+        for fmt in FORMATS:
+            try:
+                r = measure(_write_sink, stage, input_file, fmt, batch_size)
+            except ImportError as e:
+                print(f"{name:<8} {fmt:<8} skipped: {e}")
+                continue
+            print(f"{name:<8} {fmt:<8} {r['seconds']:8.2f}s {rows / r['seconds']:12.0f} rows/s "
+                  f"{r['rows'] / 2**20:8.1f} MB written  peak RSS {r['peak_rss_mb']:.0f} MB")
+
+def _text_rows(input_file):
+    return int(load_tweet_frame(input_file, columns=['full_text'])['full_text'].notna().sum())
+
+def _write_sink(stage, input_file, fmt, batch_size):
+    output_file = stage(input_file, fmt=fmt, batch_size=batch_size)
+    if isinstance(output_file, tuple):
+        output_file = output_file[1]
+    return os.path.getsize(output_file)
+
+def tfidf_in_memory(input_file):
+    tweets = load_tweet_frame(input_file, columns=['full_text', 'hashtags', 'user_mentions'])
+    return analyze_tweets(tweets[tweets['full_text'].notna()])['total_tweets']
+
+def tfidf_hashed(input_file):
+    return analyze_tweets_hashed(input_file)['total_tweets']
+
+def bench_tfidf(input_file):
+    load_tweet_frame(input_file, columns=['full_text'])  # build the store outside the timings
+    for name, func in [('TfidfVectorizer', tfidf_in_memory), ('HashingVectorizer', tfidf_hashed)]:
+        r = measure(func, input_file)
+        print(f"{name:<17} {r['seconds']:8.2f}s {r['rows'] / r['seconds']:12.0f} tweets/s  peak RSS {r['peak_rss_mb']:.0f} MB")
+
+# cloud.analyze_tweets before tokenize_texts: one simple_tokenize pass for the
+# word counts and another for the Counter
+def legacy_word_frequencies(texts):
+    word_counts = [len(cloud.simple_tokenize(text)) for text in texts]
+    word_freq = Counter([word for text in texts for word in cloud.simple_tokenize(text) if len(word) > 1])
+    return word_counts, word_freq
+
+# The archive's cloud texts are repeated up to `texts` so the size is comparable across archives
+def bench_tokens(input_file, workers=(1, 2, 4), texts=1000000):
+    _, archive_texts = cloud.extract_full_text(input_file)
+    texts = (archive_texts * -(-texts // max(len(archive_texts), 1)))[:texts]
+    start = time.perf_counter()
+    word_counts, word_freq = legacy_word_frequencies(texts)
+    baseline = time.perf_counter() - start
+    print(f"Texts: {len(texts)}")
+    print(f"{'two simple_tokenize passes':<27} {baseline:8.2f}s {len(texts) / baseline:12.0f} texts/s")
+    # Counts only is the --no-summary path; with sentences also splits the texts for summarize
+    for n in workers:
+        for sentences in [False, True]:
+            start = time.perf_counter()
+            tokenized = cloud.tokenize_texts(texts, workers=n, sentences=sentences)
+            seconds = time.perf_counter() - start
+            if list(tokenized['word_counts']) != word_counts or list(tokenized['word_freq'].items()) != list(word_freq.items()):
+                raise AssertionError(f"tokenize_texts(workers={n}, sentences={sentences}) differs from the two-pass counts")
+            name = f"tokenize_texts -w {n}{' +sentences' if sentences else ''}"
+            print(f"{name:<27} {seconds:8.2f}s {len(texts) / seconds:12.0f} texts/s  speedup {baseline / seconds:5.2f}x")
+    print(f"Word counts and frequencies (including most_common order) match (cpu_count={os.cpu_count()})")
+
+def _draw_cloud(word_freq, top_n, path):
+    data = cloud.cloud_frequencies(word_freq, top_n)
+    cloud.draw_wordcloud(data, path)
+    return len(data)
+
+# Word cloud runtime and peak RSS per top-N (0: every word). vocabulary pads the
+# archive's Counter with rare synthetic words to model a large archive
+def bench_wordcloud(input_file, top_n=(50, 200, 1000, 0), vocabulary=0):
+    _, texts = cloud.extract_full_text(input_file)
+    word_freq = cloud.tokenize_texts(texts)['word_freq']
+    word_freq.update({f'word{i}': 1 + i % 3 for i in range(vocabulary)})
+    print(f"Vocabulary: {len(word_freq)} words")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for n in top_n:
+            r = measure(_draw_cloud, word_freq, n or None, os.path.join(output_dir, 'wordcloud.png'))
+            print(f"top {n or 'all':<6} {r['rows']:8} words in {r['seconds']:8.2f}s  peak RSS {r['peak_rss_mb']:.0f} MB")
+
+def _best_ms(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+# Each time view computed by scanning the per-tweet frame vs rolled up from the cube
+def bench_cube(input_file):
+    tweets = weekly.process_tweets(weekly.load_tweets(input_file))
+    if os.path.exists(cube_paths(input_file)[0]):
+        os.remove(cube_paths(input_file)[0])
+    start = time.perf_counter()
+    cube = load_cube(input_file)
+    print(f"{len(tweets)} tweets -> cube of {len(cube)} cells "
+          f"({os.path.getsize(cube_paths(input_file)[0]) / 1024:.0f} KB) built in {time.perf_counter() - start:.2f}s")
+    created_at = tweets['created_at']
+    views = [
+        ('daily', lambda: tweets.set_index('created_at').resample('D').sum(), lambda: period_counts(cube, 'D')),
+        ('weekly', lambda: weekly.weekly_analysis(tweets), lambda: period_counts(cube, 'W')),
+        ('monthly', lambda: weekly.monthly_analysis(tweets), lambda: period_counts(cube, 'M')),
+        ('hourly', lambda: tweets.groupby(created_at.dt.hour).size(), lambda: hourly_counts(time_cells(cube))),
+        ('weekday', lambda: tweets.groupby(created_at.dt.weekday).size(), lambda: weekday_counts(time_cells(cube))),
+    ]
+    for name, scan, rollup in views:
+        print(f"{name:<8} scan {_best_ms(scan):9.1f} ms  cube {_best_ms(rollup):7.1f} ms")
+
+# Bytes per tweet of each compute_features column, as computed and in the
+# compact schema (derived columns are dropped there)
+def bench_memory(input_file):
+    df = compute_features(load_tweet_frame(input_file, columns=['created_at', 'full_text']))
+    compact = compact_features(df)
+    compare_frames(df, expand_features(compact))
+    before, after = df.memory_usage(deep=True, index=False), compact.memory_usage(deep=True, index=False)
+    print(f"{'column':<25} {'before':>8} {'after':>8}  bytes/tweet ({len(df)} tweets)")
+    for column in df.columns:
+        dtypes = f"{df[column].dtype} -> {compact[column].dtype if column in compact else 'derived'}"
+        print(f"{column:<25} {before[column] / len(df):8.1f} {after.get(column, 0) / len(df):8.1f}  {dtypes}")
+    print(f"{'total':<25} {before.sum() / len(df):8.1f} {after.sum() / len(df):8.1f}  "
+          f"({before.sum() / after.sum():.1f}x smaller; expand_features restores the frame exactly)")
+
+BENCHMARKS = {
+    'loader': bench_loader,
+    'timestamps': bench_timestamps,
+    'features': bench_features,
+    'workers': bench_workers,
+    'sinks': bench_sinks,
+    'tfidf': bench_tfidf,
+    'tokens': bench_tokens,
+    'wordcloud': bench_wordcloud,
+    'cube': bench_cube,
+    'memory': bench_memory,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=list(BENCHMARKS))
+    parser.add_argument('input_file')
+    parser.add_argument('--workers', type=int, nargs='+', help='worker counts for the workers and tokens benchmarks')
+    parser.add_argument('--batch-size', type=int, help='batch size for the sinks benchmark')
+    parser.add_argument('--texts', type=int, help='number of texts for the tokens benchmark')
+    parser.add_argument('--top-n', type=int, nargs='+', help='word counts for the wordcloud benchmark (0: all)')
+    parser.add_argument('--vocabulary', type=int, help='synthetic words added for the wordcloud benchmark')
+    args = parser.parse_args()
+    options = {'workers': args.workers} if args.workers else {}
+    if args.batch_size:
+        options['batch_size'] = args.batch_size
+    if args.texts:
+        options['texts'] = args.texts
+    if args.top_n:
+        options['top_n'] = args.top_n
+    if args.vocabulary:
+        options['vocabulary'] = args.vocabulary
+    BENCHMARKS[args.benchmark](args.input_file, **options)
@@ -1,74 +1,169 @@
-import json
+import argparse
 import os
 import re
-from datetime import datetime
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
 import pandas as pd
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 from sklearn.feature_extraction.text import TfidfVectorizer
+import instrument
+from instrument import stage
+from render import render_figures
+from store import load_tweet_frame
+
+FONT_PATH = r'C:\Windows\Fonts\meiryo.ttc'
+CLOUD_WORDS = 200  # WordCloud's own max_words default
+SUMMARY_FILE = 'tweet_summaries.csv'  # written next to the archive
 
 def clean_text(text):
     text = re.sub(r'http\S+|@\S+|#\S+', '', text)
     return re.sub(r'\s+', ' ', text).strip()
 
-def format_timestamp(ts):
-    return datetime.strptime(ts, '%a %b %d %H:%M:%S +0000 %Y').strftime('%Y-%m-%d %H:%M')
+WORDS = re.compile(r'\w\w+')  # the \w+ runs longer than one character
+SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s*')
+PUNCTUATION = re.compile(r'[.!?。！？]')
 
 def simple_tokenize(text):
-    return [word for word in re.findall(r'\w+', text) if len(word) > 1]
+    return WORDS.findall(text)
 
-def extract_summary(texts, num_sentences=3):
-    if not texts or all(len(text.strip()) == 0 for text in texts):
-        return ''
-    
-    vectorizer = TfidfVectorizer(tokenizer=simple_tokenize)
-    X = vectorizer.fit_transform(texts).sum(axis=1)
-    
-    if X.size == 0:
-        return ' '.join(texts[:num_sentences])
-    
-    return ' '.join([s for _, s in sorted(zip(X.tolist(), texts), key=lambda x: x[0], reverse=True)[:num_sentences]])
+# The single tokenization pass over a chunk of texts. With sentences, the texts
+# are also split for summarize: sentence boundaries fall on punctuation and
+# whitespace, so the tokens of a text's sentences, in order, are exactly
+# simple_tokenize(text). A sentence's tokens are kept as one space-joined
+# string: millions of small lists would keep the garbage collector busy.
+# Without sentences only the word counts and frequencies are made
+def tokenize_chunk(texts, sentences=True):
+    owners, sentence_texts, tokens, word_counts, word_freq = [], [], [], [], Counter()
+    if not sentences:
+        for text in texts:
+            words = WORDS.findall(text)
+            word_counts.append(len(words))
+            word_freq.update(words)
+        return owners, sentence_texts, tokens, word_counts, word_freq
+    for i, text in enumerate(texts):
+        count = 0
+        for sentence in [text] if PUNCTUATION.search(text) is None else SENTENCE_END.split(text):
+            if sentence.strip():
+                words = WORDS.findall(sentence)
+                owners.append(i)
+                sentence_texts.append(sentence)
+                tokens.append(' '.join(words))
+                word_freq.update(words)
+                count += len(words)
+        word_counts.append(count)
+    return owners, sentence_texts, tokens, word_counts, word_freq
+
+# Tokenize chunks in a process pool when workers > 1. Counters are merged in
+# chunk order, so word_freq keeps first-seen order and most_common breaks
+# ties exactly as a single Counter over all texts would. sentences=False skips
+# the sentence split (owners, sentences and tokens stay empty) when no
+# summaries are made
+def tokenize_texts(texts, workers=1, chunk_size=100000, sentences=True):
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(partial(tokenize_chunk, sentences=sentences), chunks))
+    else:
+        parts = [tokenize_chunk(chunk, sentences) for chunk in chunks]
+    
+    result = {'owners': [], 'sentences': [], 'tokens': [], 'word_counts': [], 'word_freq': Counter()}
+    for start, (owners, sentences, tokens, word_counts, word_freq) in zip(range(0, len(texts), chunk_size), parts):
+        result['owners'].append(np.array(owners, dtype=np.int64) + start)
+        result['sentences'].extend(sentences)
+        result['tokens'].extend(tokens)
+        result['word_counts'].extend(word_counts)
+        result['word_freq'].update(word_freq)
+    result['owners'] = np.concatenate(result['owners']) if chunks else np.zeros(0, dtype=np.int64)
+    result['word_counts'] = np.array(result['word_counts'], dtype=np.int64)
+    return result
+
+def _lowercase_words(tokens):
+    return tokens.lower().split()
+
+# Score every sentence with one TF-IDF fit over the sentences of all texts (or
+# one fit per group of texts, given as an integer label per text) and keep each text's num_sentences
+# highest-scoring sentences, best first
+def summarize(tokenized, num_sentences=3, groups=None):
+    owners, sentences = tokenized['owners'], tokenized['sentences']
+    sentence_groups = np.zeros(len(owners), dtype=np.int64) if groups is None else np.asarray(groups)[owners]
+    scores = np.zeros(len(sentences))
+    for group in np.unique(sentence_groups):
+        rows = np.flatnonzero(sentence_groups == group)
+        try:
+            matrix = TfidfVectorizer(analyzer=_lowercase_words).fit_transform([tokenized['tokens'][i] for i in rows])
+            scores[rows] = np.asarray(matrix.sum(axis=1)).ravel()
+        except ValueError:  # no sentence has a token
+            pass
+    
+    # lexsort is stable: by text, then by score, ties keep the sentence order
+    order = np.lexsort((-scores, owners))
+    starts = np.flatnonzero(np.diff(owners[order], prepend=-1))
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.append(starts, len(order))))
+    
+    summaries = [[] for _ in tokenized['word_counts']]
+    for i in order[rank < num_sentences]:
+        summaries[owners[i]].append(sentences[i])
+    return [' '.join(summary) for summary in summaries]
 
 def extract_full_text(input_file):
-    with open(input_file, 'r', encoding='utf-8') as f:
-        tweets = json.loads(f.read().replace('window.YTD.tweets.part0 = ', ''))
+    tweets = load_tweet_frame(input_file, columns=['created_at', 'full_text'])
     
     all_texts = []
     tweet_data = []
     
-    for tweet in tweets:
-        text = tweet['tweet'].get('full_text')
+    for created_at, text in zip(tweets['created_at'].dt.strftime('%Y-%m-%d %H:%M'), tweets['full_text']):
         if text:
             full_text = clean_text(text)
             if len(full_text) > 50:
                 all_texts.append(full_text)
-                summary = extract_summary([full_text])
                 tweet_data.append({
-                    'created_at': format_timestamp(tweet['tweet']['created_at']),
-                    'full_text': full_text,
-                    'summary': summary
+                    'created_at': created_at,
+                    'full_text': full_text
                 })
     
     df = pd.DataFrame(tweet_data)
     return df, all_texts
 
-def analyze_tweets(df, texts):
+# The cloud only lays out its top words, so only those are passed on; most_common
+# keeps the Counter's tie order, so the default matches handing WordCloud the
+# whole Counter. top_n=None keeps every word
+def cloud_frequencies(word_freq, top_n=CLOUD_WORDS):
+    return pd.Series(dict(word_freq.most_common(top_n)), dtype='int64')
+
+# An empty or missing font_path (FONT_PATH outside Windows) falls back to
+# WordCloud's bundled font
+def draw_wordcloud(data, path, font_path=None):
+    if not font_path or not os.path.isfile(font_path):
+        font_path = None
+    wordcloud = WordCloud(width=800, height=400, background_color='white', max_words=max(len(data), 1),
+                          font_path=font_path).generate_from_frequencies(data.to_dict())
+    plt.figure(figsize=(10, 5))
+    plt.imshow(wordcloud, interpolation='bilinear')
+    plt.axis('off')
+    plt.tight_layout(pad=0)
+    plt.savefig(path)
+    plt.close()
+
+def analyze_tweets(df, texts, tokenized=None, cloud_words=CLOUD_WORDS):
+    if tokenized is None:
+        tokenized = tokenize_texts(texts)
     total_tweets = len(texts)
     avg_length = np.mean([len(text) for text in texts])
-    avg_words = np.mean([len(simple_tokenize(text)) for text in texts])
+    avg_words = np.mean(tokenized['word_counts'])
     
     # 単語頻度の計算
-    word_freq = Counter([word for text in texts for word in simple_tokenize(text) if len(word) > 1])
+    word_freq = tokenized['word_freq']
     top_words = word_freq.most_common(20)
     
     # 時系列分析
     df['created_at'] = pd.to_datetime(df['created_at'])
     tweets_per_day = df.resample('D', on='created_at').size()
     
-    # ワードクラウドの作成
-    wordcloud = WordCloud(width=800, height=400, background_color='white', font_path=r'C:\Windows\Fonts\meiryo.ttc').generate_from_frequencies(word_freq)
+    # ワードクラウドの入力
+    cloud_words = cloud_frequencies(word_freq, cloud_words)
     
     return {
         'total_tweets': total_tweets,
@@ -76,10 +171,10 @@ def analyze_tweets(df, texts):
         'avg_words': avg_words,
         'top_words': top_words,
         'tweets_per_day': tweets_per_day,
-        'wordcloud': wordcloud
+        'cloud_frequencies': cloud_words
     }
 
-def print_analysis_summary(analysis):
+def print_analysis_summary(analysis, font_path=FONT_PATH, output_dir='.'):
     print(f"ツイート総数: {analysis['total_tweets']}")
     print(f"平均文字数: {analysis['avg_length']:.2f}")
     print(f"平均単語数: {analysis['avg_words']:.2f}")
@@ -91,26 +186,56 @@ def print_analysis_summary(analysis):
     print("\n日別ツイート数:")
     print(analysis['tweets_per_day'].to_string())
     
-    # ワードクラウドの保存
-    plt.figure(figsize=(10, 5))
-    plt.imshow(analysis['wordcloud'], interpolation='bilinear')
-    plt.axis('off')
-    plt.tight_layout(pad=0)
-    plt.savefig('wordcloud.png')
-    print("\nワードクラウドを 'wordcloud.png' として保存しました。")
+    # ワードクラウドの保存 (頻度が前回と同じなら保存済みの画像を再利用)
+    jobs = [('wordcloud.png', draw_wordcloud, analysis['cloud_frequencies'], {'font_path': font_path})]
+    if render_figures(jobs, output_dir):
+        print("\nワードクラウドを 'wordcloud.png' として保存しました。")
+    else:
+        print("\n単語頻度に変更がないため 'wordcloud.png' を再利用しました。")
+
+def run(input_file, workers=1, summary=True, summary_window=None, cloud_words=CLOUD_WORDS, font_path=FONT_PATH, output_dir='.'):
+    with stage('cloud.extract') as record:
+        df, all_tweets = extract_full_text(input_file)
+        record['rows'] = len(all_tweets)
+    with stage('cloud.tokenize', len(all_tweets)):
+        tokenized = tokenize_texts(all_tweets, workers=workers, sentences=summary)
+    if summary:
+        with stage('cloud.summarize', len(all_tweets)):
+            groups = pd.factorize(pd.to_datetime(df['created_at']).dt.to_period(summary_window))[0] if summary_window else None
+            df['summary'] = summarize(tokenized, groups=groups)
+        summary_file = os.path.join(os.path.dirname(input_file), SUMMARY_FILE)
+        with stage('cloud.save_summaries', len(df)):
+            df.to_csv(summary_file, index=False, encoding='utf-8')
+    with stage('cloud.analyze', len(all_tweets)):
+        analysis = analyze_tweets(df, all_tweets, tokenized, cloud_words=cloud_words)
+    print_analysis_summary(analysis, font_path=font_path, output_dir=output_dir)
+    if summary:
+        print(f"ツイートごとの要約を '{summary_file}' に保存しました。")
+    return analysis
 
 def main():
-    input_file = r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js'
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', nargs='?',
+                        default=r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js')
+    parser.add_argument('--no-summary', action='store_true', help='skip the per-tweet sentence summaries')
+    parser.add_argument('--workers', type=int, default=1, help='processes for tokenization')
+    parser.add_argument('--cloud-words', type=int, default=CLOUD_WORDS, help='words laid out in the word cloud (0: all)')
+    parser.add_argument('--font-path', default=FONT_PATH, help="font for the word cloud (empty or missing: WordCloud's bundled font)")
+    parser.add_argument('--summary-window', help="fit the summary TF-IDF per period ('D', 'W', ...) instead of once")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.configure_from_args(args)
+    input_file = args.input_file
     
     if not os.path.exists(input_file):
         print(f"Error: File not found at {input_file}")
         return
     
-    df, all_tweets = extract_full_text(input_file)
-    analysis = analyze_tweets(df, all_tweets)
-    print_analysis_summary(analysis)
+    run(input_file, workers=args.workers, summary=not args.no_summary, summary_window=args.summary_window,
+        cloud_words=args.cloud_words or None, font_path=args.font_path)
     
     print("\n処理が完了しました。")
+    instrument.report()
 
 if __name__ == "__main__":
     main()
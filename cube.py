@@ -0,0 +1,86 @@
+import json
+import os
+import pandas as pd
+from instrument import stage
+from store import iter_tweet_batches, load_tweet_frame, store_hash
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+TWEET_TYPES = ['original', 'retweet', 'reply']
+WEEKDAY_NAMES = {0: 'Mon', 1: 'Tue', 2: 'Wed', 3: 'Thu', 4: 'Fri', 5: 'Sat', 6: 'Sun'}
+
+def cube_paths(input_file):
+    return input_file + '.cube.parquet', input_file + '.cube.json'
+
+# Tweet counts per (date, hour, tweet_type), one row per non-empty cell; tweets
+# without text have no type and are left out, as in weekly.py and plot.py
+def build_cube(tweets):
+    tweets = tweets[tweets['tweet_type'].notna()]
+    keys = pd.DataFrame({
+        'date': tweets['created_at'].dt.floor('D'),
+        'hour': tweets['created_at'].dt.hour,
+        'tweet_type': tweets['tweet_type'],
+    })
+    return keys.groupby(['date', 'hour', 'tweet_type']).size().rename('count').reset_index()
+
+def merge_cubes(cubes):
+    return pd.concat(cubes).groupby(['date', 'hour', 'tweet_type'])['count'].sum().reset_index()
+
+# Load the archive's cube, building it from the store one batch at a time when
+# the store has changed since it was built
+def load_cube(input_file, batch_size=100000):
+    if pyarrow is None:
+        return build_cube(load_tweet_frame(input_file, columns=['created_at', 'tweet_type']))
+    cube_file, key_file = cube_paths(input_file)
+    archive_hash = store_hash(input_file)
+    if os.path.exists(cube_file) and os.path.exists(key_file):
+        with open(key_file, 'r', encoding='utf-8') as f:
+            if json.load(f)['sha256'] == archive_hash:
+                return pd.read_parquet(cube_file)
+
+    with stage('cube.build') as record:
+        cube = merge_cubes([build_cube(tweets) for tweets in iter_tweet_batches(
+            input_file, columns=['created_at', 'tweet_type'], batch_size=batch_size)])
+        record['rows'] = int(cube['count'].sum())
+    cube.to_parquet(cube_file, index=False)
+    with open(key_file, 'w', encoding='utf-8') as f:
+        json.dump({'sha256': archive_hash}, f)
+    return cube
+
+# Roll-ups. Each reads only the cube, whose size is bounded by days x 24 x 3
+
+# is_original/is_retweet/is_reply counts per freq period ('D', 'W', 'M'), as
+# weekly.py resamples them from the tweets
+def period_counts(cube, freq):
+    counts = cube.pivot_table(index='date', columns='tweet_type', values='count', aggfunc='sum', fill_value=0)
+    counts = counts.reindex(columns=TWEET_TYPES, fill_value=0).astype('int64')
+    counts.columns = ['is_' + name for name in TWEET_TYPES]
+    counts.index.name = 'created_at'
+    return counts.resample(freq).sum()
+
+# The (hour, weekday_name, time_of_day, tweet_type) cells weighted by 'count',
+# for the groupings plot.py makes over its per-tweet frame
+def time_cells(cube):
+    hour = cube['hour'].astype('int32')
+    return pd.DataFrame({
+        'hour': hour,
+        'weekday_name': cube['date'].dt.weekday.map(WEEKDAY_NAMES),
+        'time_of_day': pd.cut(hour, bins=[0, 6, 12, 18, 24], labels=['Night', 'Morning', 'Afternoon', 'Evening']),
+        'tweet_type': cube['tweet_type'],
+        'count': cube['count'],
+    })
+
+def hourly_counts(cells):
+    return cells.groupby('hour')['count'].sum().rename(None)
+
+def hour_and_type_counts(cells):
+    return cells.groupby(['hour', 'tweet_type'])['count'].sum().unstack()
+
+def weekday_counts(cells):
+    return cells.groupby('weekday_name')['count'].sum().rename(None)
+
+def weekday_and_time_counts(cells):
+    return cells.groupby(['weekday_name', 'time_of_day'])['count'].sum().unstack()
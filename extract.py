@@ -1,41 +1,77 @@
-import json
+import argparse
 import os
-import csv
 import re
-from datetime import datetime
+import pandas as pd
+import instrument
+from instrument import stage
+from incremental import align, diff_ids, load_state, save_state, state_path
+from sinks import FORMATS, open_sink, output_path
+from store import iter_tweet_batches, load_tweet_frame
 
 def clean_text(text):
     text = re.sub(r'\s+', ' ', text).strip()
     text = re.sub(r'http\S+', '', text)
     return text
 
-def format_timestamp(timestamp_str):
-    dt = datetime.strptime(timestamp_str, '%a %b %d %H:%M:%S +0000 %Y')
-    return dt.strftime('%Y-%m-%d %H:%M')
+def clean_rows(tweets):
+    with stage('extract.clean_rows', len(tweets)):
+        return pd.DataFrame({
+            'id': tweets['id'].to_numpy(),
+            'created_at': tweets['created_at'].dt.strftime('%Y-%m-%d %H:%M').to_numpy(),
+            'full_text': [clean_text(text) for text in tweets['full_text']],
+        })
 
-def extract_full_text(input_file):
+# Reuse the rows cleaned by the previous run and clean only tweets not seen before
+def update_rows(tweets, input_file):
+    rows_file = state_path(input_file, 'extract')
+    rows = load_state(rows_file)
+    if rows is None or not tweets['id'].is_unique:
+        rows = clean_rows(tweets)
+    else:
+        new, removed = diff_ids(tweets['id'], rows['id'])
+        rows = align(pd.concat([rows[~removed], clean_rows(tweets[new])], ignore_index=True), tweets['id'])
+    save_state(rows, rows_file)
+    return rows
+
+# Cleaned rows go to the sink one batch at a time, so memory is bounded by
+# batch_size; incremental runs keep the whole id-keyed state in memory
+def extract_full_text(input_file, incremental=False, fmt='csv', batch_size=100000):
     input_dir = os.path.dirname(input_file)
-    output_file = os.path.join(input_dir, 'extracted_tweets.csv')
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read().replace('window.YTD.tweets.part0 = ', '')
+    output_file = output_path(input_dir, 'extracted_tweets', fmt)
+    columns = ['id', 'created_at', 'full_text']
     
-    tweets = json.loads(content)
+    if incremental:
+        tweets = load_tweet_frame(input_file, columns=columns)
+        rows = update_rows(tweets[tweets['full_text'].notna()].reset_index(drop=True), input_file)
+        batches = (rows.iloc[start:start + batch_size] for start in range(0, len(rows), batch_size))
+    else:
+        batches = (clean_rows(tweets[tweets['full_text'].notna()]) for tweets
+                   in iter_tweet_batches(input_file, columns=columns, batch_size=batch_size))
     
-    with open(output_file, 'w', encoding='utf-8', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['created_at', 'full_text']) 
-        
-        for tweet in tweets:
-            if 'full_text' in tweet['tweet']:
-                created_at = format_timestamp(tweet['tweet']['created_at'])
-                full_text = clean_text(tweet['tweet']['full_text'])
-                writer.writerow([created_at, full_text])
+    with open_sink(output_file, fmt, lineterminator='\r\n', columns=['created_at', 'full_text']) as write:
+        for batch in batches:
+            write(batch[['created_at', 'full_text']])
 
     return output_file
 
 # 使用例
-input_file = r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', nargs='?',
+                        default=r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js')
+    parser.add_argument('--incremental', action='store_true', help='only clean tweets not seen by the previous run')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='output format (default: csv)')
+    parser.add_argument('--batch-size', type=int, default=100000, help='tweets written per batch')
+    parser.add_argument('--index', action='store_true', help='also build the SQLite full-text index (see index.py)')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.configure_from_args(args)
 
-output_file = extract_full_text(input_file)
-print(output_file)
+    output_file = extract_full_text(args.input_file, incremental=args.incremental,
+                                    fmt=args.format, batch_size=args.batch_size)
+    print(output_file)
+    if args.index:
+        from index import build_index  # index.py imports clean_text from here
+        with stage('extract.index'):
+            print(build_index(args.input_file, batch_size=args.batch_size))
+    instrument.report()
@@ -1,123 +1,478 @@
-import json
+import argparse
 import os
-import csv
 import re
-from datetime import datetime
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import instrument
+from instrument import collect, in_worker, stage
+from incremental import align, diff_ids, load_state, save_state, state_path, update_counts
+from sinks import FORMATS, open_sink, output_path
+from store import iter_tweet_batches, load_tweet_frame
 
 def clean_text(text):
     text = re.sub(r'\s+', ' ', text).strip()
     text = re.sub(r'http\S+', '', text)
     return text
 
-def format_timestamp(timestamp_str):
-    dt = datetime.strptime(timestamp_str, '%a %b %d %H:%M:%S +0000 %Y')
-    return dt
+# RE2 (pyarrow.compute) classes such as \s and \w are ASCII-only, so the
+# character classes below are enumerated from Python's own str predicates to
+# keep the Arrow kernels matching the re/str behaviour of clean_text exactly.
+# numpy.strings applies the same per-character predicates as str.isupper,
+# str.isspace and str.isalnum, over every code point at once
+_PREDICATES = {
+    'upper': np.strings.isupper,
+    'space': np.strings.isspace,
+    'space_not_blank': lambda chars: np.strings.isspace(chars) & (chars != ' '),
+    'word': lambda chars: np.strings.isalnum(chars) | (chars == '_'),
+}
 
-def extract_features(input_file):
-    input_dir = os.path.dirname(input_file)
-    output_file = os.path.join(input_dir, 'tweet_features_comprehensive.csv')
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read().replace('window.YTD.tweets.part0 = ', '')
-    
-    tweets = json.loads(content)
+@lru_cache(maxsize=None)
+def _code_points(name):
+    return _PREDICATES[name](np.arange(sys.maxunicode + 1, dtype=np.uint32).view('U1'))
+
+@lru_cache(maxsize=None)
+def _char_class(name, negate=False):
+    mask = _code_points(name).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask, [0]])))
+    ranges = ''.join(f'\\x{{{start:x}}}-\\x{{{end - 1:x}}}' for start, end in zip(edges[::2], edges[1::2]))
+    return '[' + ('^' if negate else '') + ranges + ']'
+
+# Builds the tables once in the parent, so worker processes forked from it
+# inherit them instead of each building its own
+def char_tables():
+    _byte_classes()
+    for name, negate in [('space_not_blank', False), ('space', False), ('space', True), ('word', False)]:
+        _char_class(name, negate)
+
+def _int_column(array):
+    return array.to_numpy(zero_copy_only=False).astype('int64')
+
+# Offsets and UTF-8 bytes of a string array, the offsets starting at 0
+def _utf8_buffers(text):
+    offset_type = np.int64 if pa.types.is_large_string(text.type) else np.int32
+    offsets = np.frombuffer(text.buffers()[1], dtype=offset_type)[text.offset:text.offset + len(text) + 1].astype(np.int64)
+    data = np.frombuffer(text.buffers()[2] or b'', dtype=np.uint8)[offsets[0]:offsets[-1]]
+    return offsets - offsets[0], data
+
+# Code points of the UTF-8 characters starting at the given byte positions
+def _decode_utf8(data, starts):
+    lead = data[starts].astype(np.int64)
+    tail = [data[np.minimum(starts + i, len(data) - 1)].astype(np.int64) & 0x3F for i in (1, 2, 3)]
+    return np.select([lead < 0xE0, lead < 0xF0],
+                     [(lead & 0x1F) << 6 | tail[0], (lead & 0x0F) << 12 | tail[0] << 6 | tail[1]],
+                     (lead & 0x07) << 18 | tail[0] << 12 | tail[1] << 6 | tail[2])
+
+# Rows of text that contain an ASCII substring, searched in the UTF-8 bytes
+def contains(text, substring):
+    offsets, data = _utf8_buffers(text)
+    starts = np.flatnonzero(data == ord(substring[0]))
+    for i, char in enumerate(substring[1:], 1):
+        starts = starts[data[np.minimum(starts + i, len(data) - 1)] == ord(char)]
+    rows = np.searchsorted(offsets, starts, side='right') - 1
+    found = np.zeros(len(text), dtype=bool)
+    found[rows[starts + len(substring) <= offsets[rows + 1]]] = True
+    return found
+
+COUNTED = ['@', '#', '!', '?', 'http']  # ASCII; no two share a first byte, none overlaps itself
+_UPPER, _MAYBE_UPPER = len(COUNTED) + 1, len(COUNTED) + 2
+
+# Class of every byte value: 1.. for the first bytes of COUNTED, _UPPER for
+# A-Z and _MAYBE_UPPER for the lead bytes of non-ASCII uppercase characters
+@lru_cache(maxsize=None)
+def _byte_classes():
+    classes = np.zeros(256, dtype=np.uint8)
+    classes[[chr(code).encode()[0] for code in np.flatnonzero(_code_points('upper')) if code >= 0x80]] = _MAYBE_UPPER
+    classes[ord('A'):ord('Z') + 1] = _UPPER
+    for number, substring in enumerate(COUNTED, 1):
+        classes[ord(substring[0])] = number
+    return classes
+
+# Per-row counts of each of COUNTED and of uppercase letters (str.isupper),
+# in one pass over the UTF-8 bytes (bytes.translate is much faster than a
+# NumPy lookup): ASCII bytes never occur inside multi-byte characters, and only
+# the characters whose lead byte could start an uppercase letter are decoded
+def char_counts(text):
+    offsets, data = _utf8_buffers(text)
+    classes = np.frombuffer(data.tobytes().translate(_byte_classes().tobytes()), dtype=np.uint8)
+    positions = np.flatnonzero(classes != 0)
+    codes = classes[positions]
+    rows = np.searchsorted(offsets, positions, side='right') - 1
+    for number, substring in enumerate(COUNTED, 1):
+        if len(substring) > 1:
+            at = np.flatnonzero(codes == number)
+            found = positions[at] + len(substring) <= offsets[rows[at] + 1]
+            for i, char in enumerate(substring[1:], 1):
+                found &= data[np.minimum(positions[at] + i, len(data) - 1)] == ord(char)
+            codes[at[~found]] = 0
+    maybe = np.flatnonzero(codes == _MAYBE_UPPER)
+    codes[maybe] = np.where(_code_points('upper')[_decode_utf8(data, positions[maybe])], _UPPER, 0)
+    counts = np.bincount(rows * _MAYBE_UPPER + codes, minlength=len(text) * _MAYBE_UPPER)
+    return counts.reshape(len(text), _MAYBE_UPPER)[:, 1:_MAYBE_UPPER].T
+
+# Arrow strings as an object array, reusing the Python strings of base (the
+# same rows before a transformation, base_text in Arrow) where the value is
+# unchanged: building Python strings is the costly part of the conversion
+def reuse_strings(text, base_text, base):
+    changed = pc.not_equal(text, base_text).to_numpy(zero_copy_only=False)
+    values = base.copy()
+    values[changed] = text.filter(changed).to_pylist()
+    return values
+
+# labels[codes] (codes may be a boolean mask) as an object array; taking the
+# Python strings is cheaper than converting a NumPy string array
+def labels(codes, names):
+    return np.array(names, dtype=object)[np.asarray(codes, dtype=np.int64)]
+
+# datetime.date of every timestamp, one object per distinct day
+def dates(created_at):
+    codes, days = pd.factorize(created_at.to_numpy().astype('datetime64[D]'))
+    return pd.Series(pd.DatetimeIndex(days).date[codes], index=created_at.index, dtype=object)
+
+# clean_text on a whole column (a Series or an Arrow array); rows with only
+# single blanks skip the regex pass
+def clean_column(full_text):
+    text = pa.array(full_text, type=pa.large_string())
+    needs_collapse = pc.match_substring_regex(text, '  |' + _char_class('space_not_blank'))
+    collapsed = pc.replace_substring_regex(text.filter(needs_collapse), _char_class('space') + '+', ' ')
+    text = pc.replace_with_mask(text, needs_collapse, collapsed)
+    text = pc.utf8_trim(text, ' ')
+    has_url = contains(text, 'http')
+    removed = pc.replace_substring_regex(text.filter(has_url), 'http' + _char_class('space', negate=True) + '+', '')
+    return pc.replace_with_mask(text, has_url, removed)
+
+# Word count and distinct word count, matching len(x.split()) and len(set(x.split())).
+# Cleaned text has no whitespace other than ' ', so splitting on it is exact.
+def word_counts(text):
+    pieces = pc.split_pattern(text, ' ')
+    rows = pc.list_parent_indices(pieces).to_numpy()
+    words = pc.dictionary_encode(pc.list_flatten(pieces))
+    codes = words.indices.to_numpy()
+    vocabulary = len(words.dictionary)
+    keys = rows * vocabulary + codes
+    keys = np.sort(keys.astype(np.int32) if len(text) * vocabulary < 2**31 else keys)
+    first = np.ones(len(keys), dtype=bool)
+    np.not_equal(keys[1:], keys[:-1], out=first[1:])
+    # Runs of blanks and leading/trailing blanks split into empty strings,
+    # which are taken out of both counts
+    blanks = np.bincount(rows[codes == pc.index(words.dictionary, '').as_py()], minlength=len(text))
+    return (_int_column(pc.list_value_length(pieces)) - blanks,
+            np.bincount(keys[first] // vocabulary, minlength=len(text)) - (blanks > 0))
+
+# Calendar fields of every timestamp as int64 arrays, from NumPy's datetime units
+def calendar_fields(created_at):
+    minutes = created_at.to_numpy().astype('datetime64[m]')
+    days, months = minutes.astype('datetime64[D]'), minutes.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    minute_of_day = (minutes - days).astype(np.int64)
+    return {
+        'year': years.astype(np.int64) + 1970,
+        'month': (months - years).astype(np.int64) + 1,
+        'day': (days - months).astype(np.int64) + 1,
+        'hour': minute_of_day // 60,
+        'minute': minute_of_day % 60,
+        'weekday': (days.astype(np.int64) + 3) % 7,  # 1970-01-01 was a Thursday
+    }
+
+# '%Y-%m-%d %H:%M' for every timestamp, the digits written straight into a
+# fixed-width UTF-32 array
+def minute_strings(created_at, fields=None):
+    fields = fields or calendar_fields(created_at)
+    chars = np.tile(np.array([ord(c) for c in '0000-00-00 00:00'], dtype=np.uint32), (len(created_at), 1))
+    for name, column, width in [('year', 0, 4), ('month', 5, 2), ('day', 8, 2), ('hour', 11, 2), ('minute', 14, 2)]:
+        for digit in range(width):
+            chars[:, column + width - 1 - digit] += (fields[name] // 10 ** digit % 10).astype(np.uint32)
+    return pd.Series(chars.view('U16').ravel(), dtype=object)
+
+# Only rows with an '@' (has_mention, when already known) go through the regex
+def strip_mentions(text, has_mention=None):
+    has_mention = contains(text, '@') if has_mention is None else has_mention
+    stripped = pc.replace_substring_regex(text.filter(has_mention), '@' + _char_class('word') + '+', '')
+    return pc.utf8_trim(pc.replace_with_mask(text, has_mention, stripped), ' ')
+
+def ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+# pd.cut for fixed increasing bins, the codes from np.searchsorted
+def cut(values, bins, labels):
+    codes = np.searchsorted(bins, np.asarray(values), side='left') - 1
+    codes[codes >= len(labels)] = -1
+    return pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+
+# Per-row features: everything that depends on a single tweet only
+def row_features(tweets):
+    has_text = tweets['full_text'].notna().to_numpy()
+    if not has_text.all():
+        tweets = tweets[has_text]
+    created_at = pd.Series(tweets['created_at'].to_numpy())
+    full_text = tweets['full_text'].to_numpy()
+    full_text_array = pa.array(full_text, type=pa.large_string())
+    text = clean_column(full_text_array)
+    text_values = reuse_strings(text, full_text_array, full_text)
+    word_count, unique_word_count = word_counts(text)
+    mention_count, hashtag_count, exclamation_count, question_count, url_count, uppercase_count = char_counts(text)
     
-    features = []
-    for tweet in tweets:
-        if 'full_text' in tweet['tweet']:
-            dt = format_timestamp(tweet['tweet']['created_at'])
-            text = clean_text(tweet['tweet']['full_text'])
-            
-            feature = {
-                'created_at': dt.strftime('%Y-%m-%d %H:%M'),
-                'year': dt.year,
-                'month': dt.month,
-                'day': dt.day,
-                'hour': dt.hour,
-                'minute': dt.minute,
-                'weekday': dt.weekday(),
-                'text': text,
-                'char_count': len(text),
-                'word_count': len(text.split()),
-                'mention_count': text.count('@'),
-                'hashtag_count': text.count('#'),
-                'url_count': text.count('http'),
-                'exclamation_count': text.count('!'),
-                'question_count': text.count('?'),
-                'is_retweet': 1 if text.startswith('RT @') else 0,
-                'is_reply': 1 if text.startswith('@') else 0,
-            }
-            
-            features.append(feature)
+    fields = calendar_fields(created_at)
     
-    df = pd.DataFrame(features)
+    df = pd.DataFrame({
+        'created_at': minute_strings(created_at, fields),
+        **fields,
+        'text': text_values,
+        'char_count': _int_column(pc.utf8_length(text)),
+        'word_count': word_count,
+        'mention_count': mention_count,
+        'hashtag_count': hashtag_count,
+        'url_count': url_count,
+        'exclamation_count': exclamation_count,
+        'question_count': question_count,
+        'is_retweet': _int_column(pc.starts_with(text, 'RT @')),
+        'is_reply': _int_column(pc.starts_with(text, '@')),
+    })
     
     # Time-related features
-    df['is_weekend'] = df['weekday'].apply(lambda x: 1 if x >= 5 else 0)
-    df['day_type'] = df['weekday'].apply(lambda x: 'weekend' if x >= 5 else 'weekday')
-    df['time_category'] = pd.cut(df['hour'], 
-                                 bins=[-0.1, 6, 12, 18, 23.1], 
-                                 labels=['night', 'morning', 'afternoon', 'evening'])
-    df['season'] = pd.cut(df['month'], 
-                          bins=[-0.1, 3, 6, 9, 12.1], 
-                          labels=['winter', 'spring', 'summer', 'autumn'])
+    df['is_weekend'] = (df['weekday'] >= 5).astype('int64')
+    df['day_type'] = labels(df['weekday'] >= 5, ['weekday', 'weekend'])
+    df['time_category'] = cut(df['hour'], 
+                              bins=[-0.1, 6, 12, 18, 23.1], 
+                              labels=['night', 'morning', 'afternoon', 'evening'])
+    df['season'] = cut(df['month'], 
+                       bins=[-0.1, 3, 6, 9, 12.1], 
+                       labels=['winter', 'spring', 'summer', 'autumn'])
     
     # Tweet content features
-    df['tweet_length_category'] = pd.cut(df['char_count'], 
-                                         bins=[-0.1, 20, 50, 100, 277.1], 
-                                         labels=['short', 'medium', 'long', 'very_long'])
-    df['tweet_type'] = df.apply(lambda row: 'retweet' if row['is_retweet'] else ('reply' if row['is_reply'] else 'original'), axis=1)
-    df['has_mention'] = df['mention_count'].apply(lambda x: 1 if x > 0 else 0)
-    df['has_hashtag'] = df['hashtag_count'].apply(lambda x: 1 if x > 0 else 0)
-    df['has_url'] = df['url_count'].apply(lambda x: 1 if x > 0 else 0)
-    df['text_without_mentions'] = df['text'].apply(lambda x: re.sub(r'@\w+', '', x).strip())
-    df['capital_letter_ratio'] = df['text'].apply(lambda x: sum(1 for c in x if c.isupper()) / len(x) if len(x) > 0 else 0)
-    df['unique_word_ratio'] = df['text'].apply(lambda x: len(set(x.split())) / len(x.split()) if len(x.split()) > 0 else 0)
+    df['tweet_length_category'] = cut(df['char_count'], 
+                                      bins=[-0.1, 20, 50, 100, 277.1], 
+                                      labels=['short', 'medium', 'long', 'very_long'])
+    df['tweet_type'] = labels(np.select([df['is_retweet'] == 1, df['is_reply'] == 1], [1, 2], 0), ['original', 'retweet', 'reply'])
+    df['has_mention'] = (df['mention_count'] > 0).astype('int64')
+    df['has_hashtag'] = (df['hashtag_count'] > 0).astype('int64')
+    df['has_url'] = (df['url_count'] > 0).astype('int64')
+    df['text_without_mentions'] = reuse_strings(strip_mentions(text, mention_count > 0), text, text_values)
+    df['capital_letter_ratio'] = ratio(uppercase_count, df['char_count'].to_numpy())
+    df['unique_word_ratio'] = ratio(unique_word_count, word_count)
     
     # Engagement features
-    df['mention_category'] = pd.cut(df['mention_count'], 
-                                    bins=[-0.1, 0, 1, 2, float('inf')], 
-                                    labels=['none', 'single', 'double', 'multiple'])
-    df['hashtag_category'] = pd.cut(df['hashtag_count'], 
-                                    bins=[-0.1, 0, 1, float('inf')], 
-                                    labels=['none', 'single', 'multiple'])
-    df['punctuation_intensity'] = df.apply(lambda row: 'high' if row['exclamation_count'] + row['question_count'] > 1 else 'low', axis=1)
-    
-    # Activity features
-    df['date'] = pd.to_datetime(df['created_at']).dt.date
-    tweet_frequency = df.groupby('date')['text'].count()
-    df['tweet_frequency'] = df['date'].map(tweet_frequency)
-    df['tweet_frequency_category'] = pd.cut(df['tweet_frequency'], 
-                                            bins=[0, 5, 10, float('inf')], 
-                                            labels=['low', 'medium', 'high'])
+    df['mention_category'] = cut(df['mention_count'], 
+                                 bins=[-0.1, 0, 1, 2, float('inf')], 
+                                 labels=['none', 'single', 'double', 'multiple'])
+    df['hashtag_category'] = cut(df['hashtag_count'], 
+                                 bins=[-0.1, 0, 1, float('inf')], 
+                                 labels=['none', 'single', 'multiple'])
+    df['punctuation_intensity'] = labels(df['exclamation_count'] + df['question_count'] > 1, ['low', 'high'])
     
-    hourly_tweet_count = df.groupby('hour')['text'].count()
-    df['tweet_density'] = df['hour'].map(hourly_tweet_count)
-    df['tweet_density_category'] = pd.cut(df['tweet_density'], 
-                                          bins=[0, hourly_tweet_count.quantile(0.33), 
-                                                hourly_tweet_count.quantile(0.67), float('inf')], 
-                                          labels=['low', 'medium', 'high'])
+    df['date'] = dates(created_at)
     
     # Derived features
     df['engagement_score'] = df['mention_count'] + df['hashtag_count']
-    df['engagement_category'] = pd.cut(df['engagement_score'], 
-                                       bins=[-0.1, 0, 1, 2, float('inf')], 
-                                       labels=['none', 'low', 'medium', 'high'])
-    df['tweet_complexity'] = df.apply(lambda row: 'complex' if row['char_count'] > 50 and row['unique_word_ratio'] > 0.8 else 'simple', axis=1)
+    df['engagement_category'] = cut(df['engagement_score'], 
+                                    bins=[-0.1, 0, 1, 2, float('inf')], 
+                                    labels=['none', 'low', 'medium', 'high'])
+    df['tweet_complexity'] = labels((df['char_count'] > 50) & (df['unique_word_ratio'] > 0.8), ['simple', 'complex'])
+    return df
+
+# Tweets per date and per hour; partial counts from chunks are summed by merge_counts
+def activity_counts(df):
+    return df.groupby('date').size(), df.groupby('hour').size()
+
+def merge_counts(partials):
+    date_counts, hour_counts = zip(*partials)
+    return (pd.concat(date_counts).groupby(level=0).sum(),
+            pd.concat(hour_counts).groupby(level=0).sum())
+
+# Activity features need the counts of the whole archive; they go right after 'date'
+def add_activity_features(df, date_counts, hour_counts):
+    with stage('feature.activity_features', len(df)):
+        activity = pd.DataFrame(index=df.index)
+        activity['tweet_frequency'] = df['date'].map(date_counts)
+        activity['tweet_frequency_category'] = pd.cut(activity['tweet_frequency'], 
+                                                      bins=[0, 5, 10, float('inf')], 
+                                                      labels=['low', 'medium', 'high'])
+        
+        activity['tweet_density'] = df['hour'].map(hour_counts)
+        activity['tweet_density_category'] = pd.cut(activity['tweet_density'], 
+                                                     bins=[0, hour_counts.quantile(0.33), 
+                                                           hour_counts.quantile(0.67), float('inf')], 
+                                                     labels=['low', 'medium', 'high'])
+        
+        # Inserted into a shallow copy, which leaves the other columns uncopied
+        df = df.copy(deep=False)
+        position = df.columns.get_loc('date') + 1
+        for offset, column in enumerate(activity.columns):
+            df.insert(position + offset, column, activity[column])
+        return df
+
+def _timed_row_features(tweets):
+    with stage('feature.row_features', len(tweets)):
+        return row_features(tweets)
+
+def _row_chunk(tweets):
+    df = _timed_row_features(tweets)
+    return df, activity_counts(df)
+
+# Row features run per chunk (in a process pool when workers > 1); chunks are
+# concatenated in input order and their partial counts reduced by merge_counts
+def chunked_row_features(tweets, workers=1, chunk_size=100000):
+    if workers > 1 and len(tweets) > chunk_size:
+        chunks = [tweets.iloc[start:start + chunk_size] for start in range(0, len(tweets), chunk_size)]
+        char_tables()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = [collect(part) for part in pool.map(in_worker(_row_chunk), chunks)]
+    else:
+        parts = [_row_chunk(tweets)]
+    df = pd.concat([part for part, _ in parts], ignore_index=True)
+    return df, merge_counts([counts for _, counts in parts])
+
+# The archive-wide activity features are added after the reduce, so the result
+# does not depend on workers
+def compute_features(tweets, workers=1, chunk_size=100000):
+    df, counts = chunked_row_features(tweets, workers, chunk_size)
+    return add_activity_features(df, *counts)
+
+FEATURE_COLUMNS = ['created_at', 'year', 'month', 'day', 'hour', 'minute', 'weekday', 'text', 'char_count',
+                   'word_count', 'mention_count', 'hashtag_count', 'url_count', 'exclamation_count',
+                   'question_count', 'is_retweet', 'is_reply', 'is_weekend', 'day_type', 'time_category',
+                   'season', 'tweet_length_category', 'tweet_type', 'has_mention', 'has_hashtag', 'has_url',
+                   'text_without_mentions', 'capital_letter_ratio', 'unique_word_ratio', 'mention_category',
+                   'hashtag_category', 'punctuation_intensity', 'date', 'tweet_frequency',
+                   'tweet_frequency_category', 'tweet_density', 'tweet_density_category', 'engagement_score',
+                   'engagement_category', 'tweet_complexity']
+
+# Compact schema: small unsigned ints for the calendar fields, counts and flags,
+# fixed categoricals for the labels and an Arrow string column for the text.
+# created_at, date and text_without_mentions are functions of other columns;
+# compact frames drop them and expand_features rebuilds them
+COMPACT_DTYPES = {
+    'year': 'uint16', 'month': 'uint8', 'day': 'uint8', 'hour': 'uint8', 'minute': 'uint8', 'weekday': 'uint8',
+    'text': pd.ArrowDtype(pa.string()),
+    'char_count': 'uint16', 'word_count': 'uint16', 'mention_count': 'uint16', 'hashtag_count': 'uint16',
+    'url_count': 'uint16', 'exclamation_count': 'uint16', 'question_count': 'uint16', 'engagement_score': 'uint16',
+    'is_retweet': 'uint8', 'is_reply': 'uint8', 'is_weekend': 'uint8',
+    'has_mention': 'uint8', 'has_hashtag': 'uint8', 'has_url': 'uint8',
+    'tweet_frequency': 'uint32', 'tweet_density': 'uint32',
+    'day_type': pd.CategoricalDtype(['weekday', 'weekend']),
+    'tweet_type': pd.CategoricalDtype(['original', 'reply', 'retweet']),
+    'punctuation_intensity': pd.CategoricalDtype(['high', 'low']),
+    'tweet_complexity': pd.CategoricalDtype(['complex', 'simple']),
+}
+DERIVED_COLUMNS = ['created_at', 'date', 'text_without_mentions']
+
+def compact_features(df):
+    df = df.drop(columns=[column for column in DERIVED_COLUMNS if column in df.columns])
+    return df.astype({column: dtype for column, dtype in COMPACT_DTYPES.items() if column in df.columns})
+
+# Back to the compute_features schema; the derived columns are rebuilt when
+# their inputs are present
+def expand_features(df):
+    df = df.astype({column: 'int64' if pd.api.types.is_integer_dtype(dtype) else object
+                    for column, dtype in COMPACT_DTYPES.items() if column in df.columns})
+    calendar = ['year', 'month', 'day', 'hour', 'minute']
+    if all(column in df.columns for column in calendar):
+        created_at = pd.to_datetime(df[calendar])
+        df['created_at'] = minute_strings(created_at).to_numpy()
+        df['date'] = dates(created_at)
+    if 'text' in df.columns:
+        df['text_without_mentions'] = strip_mentions(pa.array(df['text'], type=pa.string())).to_pandas()
+    return df[[column for column in FEATURE_COLUMNS if column in df.columns]]
+
+# Same result as compute_features, reusing the row features and counts saved by
+# the previous run: only tweets not seen before are processed, and tweets
+# deleted from the archive are taken out of the counts
+def update_features(tweets, input_file, workers=1, chunk_size=100000):
+    tweets = tweets[tweets['full_text'].notna()].reset_index(drop=True)
+    rows_file = state_path(input_file, 'features')
+    date_file, hour_file = state_path(input_file, 'feature_date_counts'), state_path(input_file, 'feature_hour_counts')
+    rows = load_state(rows_file)
+    if rows is None or not tweets['id'].is_unique:
+        rows, (date_counts, hour_counts) = chunked_row_features(tweets, workers, chunk_size)
+        rows.insert(0, 'id', tweets['id'])
+    else:
+        date_counts, hour_counts = load_state(date_file)['count'], load_state(hour_file)['count']
+        new, removed = diff_ids(tweets['id'], rows['id'])
+        added, (new_dates, new_hours) = chunked_row_features(tweets[new], workers, chunk_size)
+        added.insert(0, 'id', tweets.loc[new, 'id'].to_numpy())
+        gone_dates, gone_hours = activity_counts(rows[removed])
+        date_counts = update_counts(date_counts, new_dates, gone_dates)
+        hour_counts = update_counts(hour_counts, new_hours, gone_hours)
+        rows = align(pd.concat([rows[~removed], added], ignore_index=True), tweets['id'])
+    save_state(rows, rows_file)
+    save_state(date_counts.rename('count').to_frame(), date_file)
+    save_state(hour_counts.rename('count').to_frame(), hour_file)
+    return add_activity_features(rows.drop(columns='id'), date_counts, hour_counts)
+
+# Like pool.map, but keeps at most `workers` batches in flight so memory stays
+# bounded by the batch size
+def _bounded_map(func, items, workers):
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(in_worker(func), item))
+            if len(pending) > workers:
+                yield collect(pending.popleft().result())
+        while pending:
+            yield collect(pending.popleft().result())
+
+def _batch_counts(tweets):
+    created_at = tweets.loc[tweets['full_text'].notna(), 'created_at']
+    return activity_counts(pd.DataFrame({'date': created_at.dt.date, 'hour': created_at.dt.hour.astype('int64')}))
+
+# Two passes over the store: the archive-wide date/hour counts first, then the
+# features batch by batch, so only a batch of rows is in memory at a time
+def stream_features(input_file, workers=1, batch_size=100000):
+    with stage('feature.counts'):
+        counts = merge_counts([_batch_counts(tweets) for tweets
+                               in iter_tweet_batches(input_file, columns=['created_at', 'full_text'], batch_size=batch_size)])
+    batches = iter_tweet_batches(input_file, columns=['created_at', 'full_text'], batch_size=batch_size)
+    if workers > 1:
+        char_tables()
+    for df in _bounded_map(_timed_row_features, batches, workers):
+        yield add_activity_features(df, *counts)
+
+# Writes the features in batches; returns the output path and, when
+# keep_columns is given, those columns of every row (print_statistics uses
+# STATISTICS_COLUMNS, which leaves out the text columns), in the compact
+# schema if compact is set
+def extract_features(input_file, workers=1, incremental=False, fmt='csv', batch_size=100000, keep_columns=None, compact=False):
+    input_dir = os.path.dirname(input_file)
+    output_file = output_path(input_dir, 'tweet_features_comprehensive', fmt)
     
-    df.to_csv(output_file, index=False, encoding='utf-8')
-    return df, output_file
+    if incremental:
+        df = update_features(load_tweet_frame(input_file, columns=['id', 'created_at', 'full_text']), input_file, workers=workers)
+        batches = (df.iloc[start:start + batch_size] for start in range(0, len(df), batch_size))
+    else:
+        batches = stream_features(input_file, workers=workers, batch_size=batch_size)
+    
+    kept = []
+    with open_sink(output_file, fmt) as write:
+        for batch in batches:
+            write(batch)
+            if keep_columns is not None:
+                kept.append(compact_features(batch[keep_columns]) if compact else batch[keep_columns])
+    kept = pd.concat(kept, ignore_index=True) if kept else None
+    return kept, output_file
+
+NUMERIC_COLUMNS = ['year', 'month', 'day', 'hour', 'minute', 'weekday', 'char_count', 'word_count', 
+                   'mention_count', 'hashtag_count', 'url_count', 'exclamation_count', 'question_count', 
+                   'tweet_frequency', 'tweet_density', 'engagement_score']
+CATEGORICAL_COLUMNS = ['is_weekend', 'is_retweet', 'is_reply', 'has_mention', 'has_hashtag', 'has_url',
+                       'day_type', 'time_category', 'season', 'tweet_length_category', 'tweet_type',
+                       'mention_category', 'hashtag_category', 'punctuation_intensity',
+                       'tweet_frequency_category', 'tweet_density_category', 'engagement_category',
+                       'tweet_complexity']
+STATISTICS_COLUMNS = NUMERIC_COLUMNS + CATEGORICAL_COLUMNS
 
 def print_statistics(df):
     print("Feature Statistics:")
     print("-" * 50)
     
-    numeric_columns = ['year', 'month', 'day', 'hour', 'minute', 'weekday', 'char_count', 'word_count', 
-                       'mention_count', 'hashtag_count', 'url_count', 'exclamation_count', 'question_count', 
-                       'tweet_frequency', 'tweet_density', 'engagement_score']
-    for column in numeric_columns:
+    for column in NUMERIC_COLUMNS:
         stats = df[column].describe()
         print(f"{column}:")
         print(f"  Mean: {stats['mean']:.2f}")
@@ -127,12 +482,7 @@ def print_statistics(df):
         print(f"  Max: {stats['max']:.2f}")
         print()
     
-    categorical_columns = ['is_weekend', 'is_retweet', 'is_reply', 'has_mention', 'has_hashtag', 'has_url',
-                           'day_type', 'time_category', 'season', 'tweet_length_category', 'tweet_type',
-                           'mention_category', 'hashtag_category', 'punctuation_intensity',
-                           'tweet_frequency_category', 'tweet_density_category', 'engagement_category',
-                           'tweet_complexity']
-    for column in categorical_columns:
+    for column in CATEGORICAL_COLUMNS:
         value_counts = df[column].value_counts(normalize=True)
         print(f"{column}:")
         for value, count in value_counts.items():
@@ -140,8 +490,25 @@ def print_statistics(df):
         print()
 
 # Usage example
-input_file = r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', nargs='?',
+                        default=r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js')
+    parser.add_argument('--workers', type=int, default=1, help='processes for per-row features')
+    parser.add_argument('--incremental', action='store_true', help='only process tweets not seen by the previous run')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='output format (default: csv)')
+    parser.add_argument('--batch-size', type=int, default=100000, help='tweets written per batch')
+    parser.add_argument('--compact', action='store_true', help='keep the statistics columns in the compact schema')
+    parser.add_argument('--no-stats', action='store_true', help='skip the statistics, so memory stays bounded by the batch size')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.configure_from_args(args)
 
-df, output_file = extract_features(input_file)
-print(f"Feature extraction completed. Data saved to {output_file}")
-print_statistics(df)
+    df, output_file = extract_features(args.input_file, workers=args.workers, incremental=args.incremental,
+                                       fmt=args.format, batch_size=args.batch_size,
+                                       keep_columns=None if args.no_stats else STATISTICS_COLUMNS, compact=args.compact)
+    print(f"Feature extraction completed. Data saved to {output_file}")
+    if df is not None:
+        with stage('feature.statistics', len(df)):
+            print_statistics(df)
+    instrument.report()
@@ -0,0 +1,34 @@
+import os
+import pandas as pd
+
+# State for incremental runs lives next to the archive and is keyed by tweet id
+def state_path(input_file, name):
+    state_dir = os.path.join(os.path.dirname(input_file), 'incremental_state')
+    os.makedirs(state_dir, exist_ok=True)
+    return os.path.join(state_dir, f'{name}.parquet')
+
+def load_state(path):
+    return pd.read_parquet(path) if os.path.exists(path) else None
+
+def save_state(df, path):
+    df.to_parquet(path)
+
+# Mask of archive rows the state has not seen, and of state rows whose tweets are gone
+def diff_ids(ids, state_ids):
+    return ~ids.isin(state_ids), ~state_ids.isin(ids)
+
+# Put cached rows (with an 'id' column) back into the archive's order
+def align(rows, ids):
+    return rows.set_index('id').loc[ids].reset_index()
+
+def update_counts(counts, added, removed):
+    counts = counts.add(added, fill_value=0).sub(removed, fill_value=0)
+    return counts[counts != 0].astype('int64')
+
+# Add/subtract resampled flag sums and reindex to the periods spanned by the archive
+def update_buckets(buckets, added, removed, span, freq):
+    def resample(df):
+        return df.set_index('created_at').resample(freq).sum()
+    buckets = buckets.add(resample(added), fill_value=0).sub(resample(removed), fill_value=0)
+    periods = pd.Series(0, index=[span.min(), span.max()]).resample(freq).sum().index
+    return buckets.reindex(periods.rename('created_at'), fill_value=0).astype('int64')
@@ -0,0 +1,187 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+from cube import WEEKDAY_NAMES
+from extract import clean_text
+from store import iter_tweet_batches, store_hash
+from tfidf import NOISE, TOP_K, top_tfidf_words
+
+WORDS = re.compile(r'\w\w+')  # cloud.py's tokens
+GROUPS = {
+    'date': 'substr(created_at, 1, 10)',
+    'month': 'substr(created_at, 1, 7)',
+    'hour': 'hour',
+    'weekday': 'weekday',
+    'tweet_type': 'tweet_type',
+}
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE tweets (id INTEGER, created_at TEXT, hour INTEGER, weekday INTEGER, tweet_type TEXT, text TEXT);
+"""
+INDEXES = """
+CREATE INDEX tweets_created_at ON tweets (created_at);
+CREATE INDEX tweets_hour ON tweets (hour);
+CREATE INDEX tweets_weekday ON tweets (weekday);
+CREATE INDEX tweets_tweet_type ON tweets (tweet_type);
+"""
+
+def index_path(input_file):
+    return input_file + '.sqlite'
+
+def _rows(tweets):
+    tweets = tweets[tweets['full_text'].notna()]
+    created_at = tweets['created_at']
+    return zip(tweets['id'].tolist(), np.datetime_as_string(created_at.to_numpy(), unit='s').tolist(),
+               created_at.dt.hour.tolist(), created_at.dt.weekday.tolist(), tweets['tweet_type'].tolist(),
+               [clean_text(text) for text in tweets['full_text']])
+
+# The tweets with text, cleaned as in extract.py, in an SQLite file next to the
+# archive: B-tree indexes on created_at (ISO, UTC), hour, weekday and
+# tweet_type, and an FTS5 trigram index over the text, which finds substrings
+# in any language (Japanese has no spaces between words). Everything is loaded
+# in one transaction into a temporary file that replaces the index when done
+def build_index(input_file, batch_size=100000):
+    index_file = index_path(input_file)
+    temp_file = index_file + '.tmp'
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    archive_hash = store_hash(input_file)
+    con = sqlite3.connect(temp_file, isolation_level=None)
+    try:
+        con.execute('PRAGMA journal_mode = OFF')
+        con.execute('PRAGMA synchronous = OFF')
+        con.execute('BEGIN')
+        for statement in SCHEMA.strip().split(';\n'):
+            con.execute(statement)
+        for tweets in iter_tweet_batches(input_file, columns=['id', 'created_at', 'full_text', 'tweet_type'], batch_size=batch_size):
+            con.executemany('INSERT INTO tweets VALUES (?, ?, ?, ?, ?, ?)', _rows(tweets))
+        con.execute("CREATE VIRTUAL TABLE tweets_fts USING fts5(text, content='tweets', tokenize='trigram')")
+        con.execute("INSERT INTO tweets_fts (tweets_fts) VALUES ('rebuild')")
+        for statement in INDEXES.strip().split(';\n'):
+            con.execute(statement)
+        con.execute("INSERT INTO meta VALUES ('sha256', ?)", (archive_hash,))
+        con.execute('COMMIT')
+    finally:
+        con.close()
+    os.replace(temp_file, index_file)
+    return index_file
+
+# A connection to the archive's index, rebuilt first when the archive changed
+def open_index(input_file, batch_size=100000):
+    index_file = index_path(input_file)
+    archive_hash = store_hash(input_file)
+    if os.path.exists(index_file):
+        con = sqlite3.connect(index_file)
+        if con.execute("SELECT value FROM meta WHERE key = 'sha256'").fetchone() == (archive_hash,):
+            return con
+        con.close()
+    return sqlite3.connect(build_index(input_file, batch_size))
+
+def _weekday(value):
+    names = {name.lower(): number for number, name in WEEKDAY_NAMES.items()}
+    return int(value) if str(value).isdigit() else names[str(value)[:3].lower()]
+
+def _escape_like(text):
+    return re.sub(r'([\\%_])', r'\\\1', text)
+
+# SQL condition and parameters for the filters shared by the queries. text
+# matches a substring of the cleaned text, case-insensitively for ASCII; since
+# and until are dates or timestamps in UTC, until exclusive
+def where(text=None, since=None, until=None, hours=None, weekdays=None, tweet_types=None):
+    clauses, params = [], []
+    if text:
+        if len(text) >= 3:
+            clauses.append('rowid IN (SELECT rowid FROM tweets_fts WHERE tweets_fts MATCH ?)')
+            params.append('"' + text.replace('"', '""') + '"')
+        else:  # shorter than a trigram: a scan of the text column
+            clauses.append("text LIKE ? ESCAPE '\\'")
+            params.append(f'%{_escape_like(text)}%')
+    if since:
+        clauses.append('created_at >= ?')
+        params.append(pd.Timestamp(since).strftime('%Y-%m-%dT%H:%M:%S'))
+    if until:
+        clauses.append('created_at < ?')
+        params.append(pd.Timestamp(until).strftime('%Y-%m-%dT%H:%M:%S'))
+    for column, values in [('hour', hours and [int(hour) for hour in hours]),
+                           ('weekday', weekdays and [_weekday(day) for day in weekdays]),
+                           ('tweet_type', tweet_types)]:
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    return ' AND '.join(clauses) or '1', params
+
+# Number of matching tweets, or a Series of counts per GROUPS key
+def count(con, by=None, **filters):
+    condition, params = where(**filters)
+    if by is None:
+        return con.execute(f'SELECT count(*) FROM tweets WHERE {condition}', params).fetchone()[0]
+    rows = con.execute(f'SELECT {GROUPS[by]}, count(*) FROM tweets WHERE {condition} GROUP BY 1 ORDER BY 1', params).fetchall()
+    counts = pd.Series(dict(rows), dtype='int64').rename_axis(by)
+    return counts.rename(WEEKDAY_NAMES) if by == 'weekday' else counts
+
+# Matching tweets, newest first
+def search(con, limit=20, **filters):
+    condition, params = where(**filters)
+    return pd.read_sql_query(f'SELECT id, created_at, tweet_type, text FROM tweets WHERE {condition} '
+                             f'ORDER BY created_at DESC LIMIT ?', con, params=params + [limit if limit else -1])
+
+def _texts(con, **filters):
+    condition, params = where(**filters)
+    return [text for text, in con.execute(f'SELECT text FROM tweets WHERE {condition}', params)]
+
+# The top_n words (cloud.py's tokens) of the matching tweets
+def word_frequencies(con, top_n=20, **filters):
+    return Counter(WORDS.findall('\n'.join(_texts(con, **filters)))).most_common(top_n)
+
+# tfidf.py's top words for the matching tweets only
+def tfidf_words(con, top_k=TOP_K, **filters):
+    texts = [' '.join(NOISE.sub('', text).lower().split()) for text in _texts(con, **filters)]
+    try:
+        return top_tfidf_words(texts, top_k)
+    except ValueError:  # no tweets, or only stop words
+        return []
+
+COMMANDS = ['build', 'count', 'search', 'words', 'tfidf']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build and query the archive\'s SQLite full-text index')
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('input_file', nargs='?',
+                        default=r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js')
+    parser.add_argument('--text', help='substring of the cleaned text (full-text index from 3 characters)')
+    parser.add_argument('--since', help='first date or timestamp, UTC (e.g. 2024-03-01)')
+    parser.add_argument('--until', help='date or timestamp to stop before, UTC')
+    parser.add_argument('--hours', type=int, nargs='+', help='hours of the day, UTC')
+    parser.add_argument('--weekdays', nargs='+', help='Mon..Sun or 0..6')
+    parser.add_argument('--weekend', action='store_true', help='same as --weekdays Sat Sun')
+    parser.add_argument('--types', nargs='+', choices=['original', 'retweet', 'reply'], help='tweet types')
+    parser.add_argument('--by', choices=list(GROUPS), help='count per group')
+    parser.add_argument('--top', type=int, help='rows to show (search, words, tfidf)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        print(f"Index saved to {build_index(args.input_file)} ({time.perf_counter() - start:.1f}s)")
+    else:
+        filters = {'text': args.text, 'since': args.since, 'until': args.until, 'hours': args.hours,
+                   'weekdays': ['Sat', 'Sun'] if args.weekend else args.weekdays, 'tweet_types': args.types}
+        con = open_index(args.input_file)
+        start = time.perf_counter()
+        if args.command == 'count':
+            result = count(con, by=args.by, **filters)
+            print(result if args.by is None else result.to_string())
+        elif args.command == 'search':
+            with pd.option_context('display.max_colwidth', 100, 'display.width', 200):
+                print(search(con, limit=args.top or 20, **filters).to_string(index=False))
+        elif args.command == 'words':
+            for word, n in word_frequencies(con, top_n=args.top or 20, **filters):
+                print(f"{word}: {n}")
+        else:
+            for word, score in tfidf_words(con, top_k=args.top or TOP_K, **filters):
+                print(f"{word}: {score:.4f}")
+        print(f"({(time.perf_counter() - start) * 1000:.0f} ms)")
@@ -0,0 +1,163 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import partial
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_settings = {'enabled': False, 'profile': None, 'json_file': None, 'profile_dir': '.'}
+_records = []
+_depth = 0
+_profile = {'profiler': None, 'snapshot': None, 'traced_peak': 0}
+_UNUSED = {}
+
+def peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+def configure(enabled=True, profile=None, json_file=None, profile_dir='.'):
+    _settings.update(enabled=enabled or profile is not None or json_file is not None,
+                     profile=profile, json_file=json_file, profile_dir=profile_dir)
+
+def settings():
+    return dict(_settings)
+
+def enabled():
+    return _settings['enabled']
+
+# Time a pipeline stage: wall time, rows (pass rows= or set record['rows']
+# inside the block), RSS change and peak RSS. Disabled, it only checks a flag,
+# so stages should be whole batches or passes, never single rows. The stage
+# named by configure(profile=...) also runs under cProfile and tracemalloc
+@contextmanager
+def stage(name, rows=None):
+    if not _settings['enabled']:
+        yield _UNUSED
+        return
+    global _depth
+    record = {'name': name, 'rows': rows, 'depth': _depth}
+    profiled = _settings['profile'] == name
+    if profiled:
+        _profile['profiler'] = _profile['profiler'] or cProfile.Profile()
+        tracemalloc.start()
+        _profile['profiler'].enable()
+    rss, record['start'] = rss_mb(), time.perf_counter()
+    _depth += 1
+    try:
+        yield record
+    finally:
+        _depth -= 1
+        record['seconds'] = time.perf_counter() - record['start']
+        if profiled:
+            _profile['profiler'].disable()
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            if traced_peak >= _profile['traced_peak']:
+                _profile['snapshot'], _profile['traced_peak'] = tracemalloc.take_snapshot(), traced_peak
+            tracemalloc.stop()
+            record['traced_peak_mb'] = traced_peak / 2**20
+        record['rss_delta_mb'] = rss_mb() - rss
+        record['peak_rss_mb'] = peak_rss_mb()
+        _records.append(record)
+
+# Records made in a worker process are handed back with drain() and added to
+# the parent's with merge()
+def drain():
+    records = list(_records)
+    del _records[:]
+    return records
+
+def merge(records):
+    _records.extend(records)
+
+# One row per stage name, in the order the stages started
+def summary():
+    stages = {}
+    for record in sorted(_records, key=lambda record: record['start']):
+        row = stages.setdefault(record['name'], {'stage': record['name'], 'depth': record['depth'], 'calls': 0,
+                                                 'seconds': 0.0, 'rows': 0, 'rss_delta_mb': 0.0, 'peak_rss_mb': 0.0})
+        row['calls'] += 1
+        row['seconds'] += record['seconds']
+        row['rows'] += record['rows'] or 0
+        row['rss_delta_mb'] += record['rss_delta_mb']
+        row['peak_rss_mb'] = max(row['peak_rss_mb'], record['peak_rss_mb'])
+    return list(stages.values())
+
+def _write_profile(name):
+    path = os.path.join(_settings['profile_dir'], f'profile_{name}')
+    _profile['profiler'].dump_stats(path + '.prof')
+    text = io.StringIO()
+    pstats.Stats(_profile['profiler'], stream=text).sort_stats('cumulative').print_stats(30)
+    text.write(f"\ntracemalloc: peak {_profile['traced_peak'] / 2**20:.1f} MB traced in one call; "
+               f"allocations still live at the end of that call:\n")
+    for line in _profile['snapshot'].statistics('lineno')[:20]:
+        text.write(f'{line}\n')
+    with open(path + '.txt', 'w', encoding='utf-8') as f:
+        f.write(text.getvalue())
+    return path
+
+# Print the summary table to stderr (stdout stays the scripts' own output),
+# write the JSON file and the profile report if configured
+def report(stream=None):
+    if not _settings['enabled']:
+        return
+    stream = stream or sys.stderr
+    rows = summary()
+    width = max([len('stage')] + [2 * row['depth'] + len(row['stage']) for row in rows])
+    stream.write(f"\n{'stage':<{width}} {'calls':>5} {'seconds':>9} {'rows':>10} {'rows/s':>10} {'ΔRSS MB':>9} {'peak MB':>8}\n")
+    for row in rows:
+        rate = f"{row['rows'] / row['seconds']:10.0f}" if row['rows'] and row['seconds'] else f"{'':>10}"
+        stream.write(f"{'  ' * row['depth'] + row['stage']:<{width}} {row['calls']:>5} {row['seconds']:9.3f} "
+                     f"{row['rows'] or '':>10} {rate} {row['rss_delta_mb']:9.1f} {row['peak_rss_mb']:8.0f}\n")
+    if _settings['json_file']:
+        with open(_settings['json_file'], 'w', encoding='utf-8') as f:
+            json.dump({'stages': rows, 'records': _records}, f, indent=2)
+    if _profile['profiler'] is not None:
+        stream.write(f"Profile of {_settings['profile']} written to {_write_profile(_settings['profile'])}.prof/.txt\n")
+    elif _settings['profile'] in [row['stage'] for row in rows]:
+        stream.write(f"Stage {_settings['profile']!r} only ran in worker processes, which are not profiled; "
+                     f"rerun with --workers 1\n")
+    elif _settings['profile']:
+        stream.write(f"Stage {_settings['profile']!r} did not run; stages seen: {', '.join(row['stage'] for row in rows)}\n")
+
+# Functions run in a process pool are wrapped with in_worker(func); the worker
+# takes the parent's settings and sends its records back with the result, and
+# collect() adds them to the parent's. Profiles are only written for stages run
+# in the parent, so profile with one worker
+def in_worker(func):
+    return partial(_call_in_worker, settings(), func)
+
+def _call_in_worker(parent_settings, func, *args):
+    _settings.update(parent_settings, profile=None)
+    del _records[:]
+    return func(*args), drain()
+
+def collect(output):
+    result, records = output
+    merge(records)
+    return result
+
+def add_arguments(parser):
+    parser.add_argument('--timings', action='store_true', help='print wall time, rows and memory per pipeline stage')
+    parser.add_argument('--timings-json', help='also write the per-stage timings to this JSON file')
+    parser.add_argument('--profile', metavar='STAGE', help='cProfile/tracemalloc report for one stage (e.g. feature.row_features)')
+
+def configure_from_args(args):
+    configure(enabled=args.timings, profile=args.profile, json_file=args.timings_json,
+              profile_dir=os.path.dirname(args.timings_json or '') or '.')
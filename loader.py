@@ -0,0 +1,66 @@
+import json
+import os
+import re
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+# Large exports are split into tweets.js, tweets-part1.js, tweets-part2.js, ...
+def part_file(input_file, part):
+    if part == 0:
+        return input_file
+    stem, ext = os.path.splitext(input_file)
+    return f'{stem}-part{part}{ext}'
+
+# The files of the archive named by input_file, in part order
+def archive_parts(input_file):
+    directory, name = os.path.split(input_file)
+    stem, ext = os.path.splitext(name)
+    pattern = re.compile(re.escape(stem) + r'-part(\d+)' + re.escape(ext) + '$')
+    numbered = sorted((int(m.group(1)), entry) for entry in os.listdir(directory or '.') if (m := pattern.match(entry)))
+    return [input_file] + [os.path.join(directory, entry) for _, entry in numbered]
+
+# A decode error at the end of the buffer means the object goes on past it;
+# anywhere else the archive itself is malformed
+def _truncated(error, buf):
+    return error.pos >= len(buf) - 8 or error.msg.startswith('Unterminated string')
+
+# Stream tweet entries from one tweets.js file without loading the whole file
+def iter_tweets(input_file, chunk_size=1 << 20):
+    with open(input_file, 'r', encoding='utf-8') as f:
+        buf = ''
+        # Skip the "window.YTD.tweets.partN = " prefix up to the opening bracket
+        while '[' not in buf:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+        offset = buf.index('[') + 1  # characters of the file before buf
+        buf = buf[offset:]
+        eof = False
+        pos = 0
+        while True:
+            if not eof and len(buf) - pos < chunk_size // 2:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf, offset, pos = buf[pos:] + chunk, offset + pos, 0
+            while pos < len(buf) and buf[pos] in _WHITESPACE + ',':
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f"Unterminated tweet array in {input_file}")
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                tweet, pos = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if eof or not _truncated(e, buf):
+                    raise ValueError(f"Malformed tweet in {input_file} at character {offset + e.pos}: {e.msg}") from e
+                # The object straddles the end of the buffer: read as much
+                # again as is left, so a large object is copied O(log n) times
+                chunk = f.read(max(chunk_size, len(buf) - pos))
+                eof = not chunk
+                buf, offset, pos = buf[pos:] + chunk, offset + pos, 0
+                continue
+            yield tweet
@@ -1,42 +1,43 @@
+import argparse
 import matplotlib.pyplot as plt
-import pandas as pd
 import seaborn as sns
 import os
-import json
-from datetime import datetime
+import instrument
+from cube import (hour_and_type_counts, hourly_counts, load_cube, time_cells,
+                  weekday_and_time_counts, weekday_counts)
+from render import render_figures
+from store import load_tweet_frame
 
-input_file = r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js'
-output_dir = os.path.dirname(input_file)
+# Tweet lengths are the only per-tweet input; the time views come from the count cube
+def load_plot_frame(input_file):
+    df = load_tweet_frame(input_file, columns=['full_text', 'tweet_type'])
+    df = df[df['full_text'].notna()].rename(columns={'full_text': 'text'}).reset_index(drop=True)
+    df['char_count'] = df['text'].str.len()
+    return df
 
-with open(input_file, 'r', encoding='utf-8') as f:
-    content = f.read().replace('window.YTD.tweets.part0 = ', '')
-tweets = json.loads(content)
+# Each distinct aggregation is computed once and shared by the figures that use it
+def aggregate(df, cells):
+    return {
+        'hour': hourly_counts(cells),
+        'hour_and_type': hour_and_type_counts(cells),
+        'weekday': weekday_counts(cells),
+        'weekday_and_time': weekday_and_time_counts(cells),
+        # Tweet counts per (length, type); histograms weight by 'count'. sort=False
+        # keeps tweet types in order of first appearance, which sets the hue order
+        'length_and_type': df.groupby(['char_count', 'tweet_type'], sort=False).size().reset_index(name='count'),
+    }
 
-df = pd.DataFrame([{
-    'created_at': datetime.strptime(tweet['tweet']['created_at'], '%a %b %d %H:%M:%S +0000 %Y'),
-    'text': tweet['tweet']['full_text'],
-    'tweet_type': 'retweet' if tweet['tweet']['full_text'].startswith('RT @') else 'reply' if tweet['tweet']['full_text'].startswith('@') else 'original',
-    'char_count': len(tweet['tweet']['full_text'])
-} for tweet in tweets if 'full_text' in tweet['tweet']])
-
-df['hour'] = df['created_at'].dt.hour
-df['weekday'] = df['created_at'].dt.weekday
-df['weekday_name'] = df['weekday'].map({0:'Mon', 1:'Tue', 2:'Wed', 3:'Thu', 4:'Fri', 5:'Sat', 6:'Sun'})
-df['time_of_day'] = pd.cut(df['hour'], bins=[0, 6, 12, 18, 24], labels=['Night', 'Morning', 'Afternoon', 'Evening'])
-
-plots = [
-    ('tweets_by_hour.png', lambda: df.groupby('hour').size().plot(kind='bar')),
-    ('tweets_by_hour_and_type.png', lambda: df.groupby(['hour', 'tweet_type']).size().unstack().plot(kind='bar', stacked=True)),
-    ('tweets_by_weekday.png', lambda: df.groupby('weekday_name').size().plot(kind='bar')),
-    ('tweets_by_weekday_and_time.png', lambda: df.groupby(['weekday_name', 'time_of_day']).size().unstack().plot(kind='bar', stacked=True)),
-    ('tweet_length_distribution.png', lambda: sns.histplot(data=df, x='char_count', bins=50)),
-    ('tweet_length_distribution_by_type.png', lambda: sns.histplot(data=df, x='char_count', hue='tweet_type', multiple='stack', bins=50)),
-    ('tweet_type_proportion_by_hour.png', lambda: df.groupby(['hour', 'tweet_type']).size().unstack().plot(kind='bar', stacked=True))
-]
-
-for filename, plot_func in plots:
+def draw(data, path, kind):
+    filename = os.path.basename(path)
     plt.figure(figsize=(12, 6))
-    ax = plot_func()
+    if kind == 'bar':
+        ax = data.plot(kind='bar')
+    elif kind == 'stacked':
+        ax = data.plot(kind='bar', stacked=True)
+    elif kind == 'hist':
+        ax = sns.histplot(data=data, x='char_count', weights='count', bins=50)
+    else:
+        ax = sns.histplot(data=data, x='char_count', weights='count', hue='tweet_type', multiple='stack', bins=50)
     plt.title(filename.replace('.png', '').replace('_', ' ').title())
     if isinstance(ax, plt.Axes):
         if 'tweet_type' in filename or 'time' in filename:
@@ -47,7 +48,38 @@ for filename, plot_func in plots:
         plt.xlabel('Tweet Length (characters)')
         plt.ylabel('Count')
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, filename))
+    plt.savefig(path)
     plt.close()
 
-print(f"Visualizations saved to {output_dir}")
+PLOTS = [
+    ('tweets_by_hour.png', 'hour', 'bar'),
+    ('tweets_by_hour_and_type.png', 'hour_and_type', 'stacked'),
+    ('tweets_by_weekday.png', 'weekday', 'bar'),
+    ('tweets_by_weekday_and_time.png', 'weekday_and_time', 'stacked'),
+    ('tweet_length_distribution.png', 'length_and_type', 'hist'),
+    ('tweet_length_distribution_by_type.png', 'length_and_type', 'hist_by_type'),
+    ('tweet_type_proportion_by_hour.png', 'hour_and_type', 'stacked'),
+]
+
+def plot_all(input_file, output_dir, workers=None):
+    with instrument.stage('plot.load') as record:
+        df, cells = load_plot_frame(input_file), time_cells(load_cube(input_file))
+        record['rows'] = len(df)
+    with instrument.stage('plot.aggregate', len(df)):
+        aggregates = aggregate(df, cells)
+    jobs = [(filename, draw, aggregates[name], {'kind': kind}) for filename, name, kind in PLOTS]
+    return render_figures(jobs, output_dir, workers=workers)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', nargs='?',
+                        default=r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js')
+    parser.add_argument('--workers', type=int, help='processes rendering figures (default: one per CPU)')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.configure_from_args(args)
+    output_dir = os.path.dirname(args.input_file)
+
+    rendered = plot_all(args.input_file, output_dir, workers=args.workers)
+    print(f"Visualizations saved to {output_dir} ({len(rendered)} of {len(PLOTS)} redrawn)")
+    instrument.report()
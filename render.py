@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import matplotlib.pyplot as plt
+from instrument import collect, in_worker, stage
+
+CACHE_FILE = '.render_cache.json'
+
+# Identify a figure by its drawing function, options and input aggregate
+def figure_hash(draw, data, options):
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    digest = hashlib.sha256(f'{draw.__module__}.{draw.__qualname__}{sorted(options.items())!r}'.encode())
+    digest.update(repr((list(frame.index.names), frame.dtypes.to_dict())).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _render(job):
+    draw, data, path, options = job
+    plt.switch_backend('Agg')
+    with stage('render.' + os.path.basename(path)):
+        draw(data, path, **options)
+    return path
+
+# Render (filename, draw, data, options) jobs into output_dir, calling
+# draw(data, path, **options) in a process pool; figures whose aggregate and
+# options are unchanged since the last run (and whose file still exists) are skipped
+def render_figures(jobs, output_dir, workers=None):
+    cache_path = os.path.join(output_dir, CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+
+    pending, hashes = [], {}
+    for filename, draw, data, options in jobs:
+        path = os.path.join(output_dir, filename)
+        hashes[filename] = figure_hash(draw, data, options)
+        if cache.get(filename) != hashes[filename] or not os.path.exists(path):
+            pending.append((draw, data, path, options))
+
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = [collect(path) for path in pool.map(in_worker(_render), pending)]
+    else:
+        rendered = [_render(job) for job in pending]
+
+    for path in rendered:
+        cache[os.path.basename(path)] = hashes[os.path.basename(path)]
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    return rendered
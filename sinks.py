@@ -0,0 +1,74 @@
+import gzip
+import os
+from contextlib import contextmanager
+from instrument import stage
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+FORMATS = ['csv', 'csv.gz', 'csv.zst', 'parquet']
+
+def output_path(output_dir, stem, fmt='csv'):
+    return os.path.join(output_dir, f'{stem}.{fmt}')
+
+def _open_text(path, fmt):
+    if fmt == 'csv':
+        return open(path, 'w', encoding='utf-8', newline='')
+    if fmt == 'csv.gz':
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    if zstandard is None:
+        raise ImportError("Writing csv.zst needs the zstandard package")
+    return zstandard.open(path, 'wt', encoding='utf-8', newline='')
+
+# Open an output for DataFrame batches and yield write(df). CSV formats write the
+# header with the first batch; parquet writes one row group per batch. Only the
+# batch being written is held in memory. If no batch comes, the output still
+# has the given columns: a header line, or an empty parquet file of strings
+@contextmanager
+def open_sink(path, fmt='csv', lineterminator=os.linesep, columns=None):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format {fmt!r}, expected one of {FORMATS}")
+    if fmt == 'parquet':
+        if pyarrow is None:
+            raise ImportError("Writing parquet needs the pyarrow package")
+        writer = None
+
+        def write(df):
+            nonlocal writer
+            if not len(df):  # an empty batch would give the writer null-typed columns
+                return
+            with stage('sink.write', len(df)):
+                table = pyarrow.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+
+        try:
+            yield write
+            if writer is None and columns is not None:
+                pq.write_table(pyarrow.table({column: pyarrow.array([], pyarrow.string()) for column in columns}), path)
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+
+    with _open_text(path, fmt) as f:
+        first = True
+
+        def write(df):
+            nonlocal first
+            with stage('sink.write', len(df)):
+                df.to_csv(f, header=first, index=False, lineterminator=lineterminator)
+            first = False
+
+        yield write
+        if first and columns is not None:
+            f.write(','.join(columns) + lineterminator)
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+import numpy as np
+import pandas as pd
+from instrument import collect, in_worker, stage
+from loader import archive_parts, iter_tweets
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+TIMESTAMP_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+_MONTH_KEYS, _MONTH_ORDER = (np.array(a) for a in zip(*sorted(
+    ((ord(m[0]) << 16) | (ord(m[1]) << 8) | ord(m[2]), i) for i, m in enumerate(_MONTHS))))
+_WEEKDAY_KEYS = np.array([(ord(d[0]) << 16) | (ord(d[1]) << 8) | ord(d[2])
+                          for d in ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']])
+_SEPARATOR_COLUMNS = [3, 7, 10, 13, 16, 19, 20, 21, 22, 23, 24, 25]
+_SEPARATOR_CODES = np.array([ord(c) for c in '   :: +0000 '])
+
+if pyarrow is not None:
+    STORE_SCHEMA = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('created_at', pyarrow.timestamp('ns')),
+        ('full_text', pyarrow.string()),
+        ('tweet_type', pyarrow.string()),
+        ('hashtags', pyarrow.list_(pyarrow.string())),
+        ('user_mentions', pyarrow.list_(pyarrow.string())),
+        ('url_count', pyarrow.int32()),
+        ('hashtag_count', pyarrow.int32()),
+        ('mention_count', pyarrow.int32()),
+    ])
+
+_settings = {'part_workers': None}
+
+# Processes parsing a multi-part archive's parts when the store is rebuilt
+# without an explicit workers (load_tweet_frame, iter_tweet_batches,
+# store_hash); None is one per CPU. batch.py sets 1: its archives already run in parallel
+def configure(part_workers=None):
+    _settings.update(part_workers=part_workers)
+
+def tweet_type(text):
+    return 'retweet' if text.startswith('RT @') else 'reply' if text.startswith('@') else 'original'
+
+def store_paths(input_file):
+    return input_file + '.parquet', input_file + '.store.json'
+
+# Size, mtime and (optionally) SHA-256 over all of the archive's parts; a
+# multi-part key also lists each part's name and size, so an added, removed or
+# resized part invalidates the store
+def archive_key(input_file, with_hash=False):
+    parts = archive_parts(input_file)
+    stats = [os.stat(part) for part in parts]
+    key = {'size': sum(stat.st_size for stat in stats), 'mtime_ns': max(stat.st_mtime_ns for stat in stats)}
+    if len(parts) > 1:
+        key['parts'] = [[os.path.basename(part), stat.st_size] for part, stat in zip(parts, stats)]
+    if with_hash:
+        digest = hashlib.sha256()
+        for part in parts:
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        key['sha256'] = digest.hexdigest()
+    return key
+
+# Parse 'Wed Sep 18 12:34:56 +0000 2024' strings in one vectorized pass over the
+# fixed-width characters; rows that don't fit the layout go through strptime
+def parse_created_at(values):
+    # One spare column so over-long values are caught instead of truncated
+    chars = np.array(values, dtype='U31')
+    codes = chars.view(np.uint32).reshape(len(chars), 31).astype(np.int64)
+    digits = codes - ord('0')
+
+    def number(start, end):
+        value = np.zeros(len(chars), dtype=np.int64)
+        for i in range(start, end):
+            value = value * 10 + digits[:, i]
+        return value
+
+    weekday_found = np.isin((codes[:, 0] << 16) | (codes[:, 1] << 8) | codes[:, 2], _WEEKDAY_KEYS)
+    month_keys = (codes[:, 4] << 16) | (codes[:, 5] << 8) | codes[:, 6]
+    month = np.searchsorted(_MONTH_KEYS, month_keys)
+    month_found = _MONTH_KEYS[np.minimum(month, 11)] == month_keys
+    year, day = number(26, 30), number(8, 10)
+    hour, minute, second = number(11, 13), number(14, 16), number(17, 19)
+
+    digit_columns = [8, 9, 11, 12, 14, 15, 17, 18, 26, 27, 28, 29]
+    valid = (np.all((digits[:, digit_columns] >= 0) & (digits[:, digit_columns] <= 9), axis=1)
+             & np.all(codes[:, _SEPARATOR_COLUMNS] == _SEPARATOR_CODES, axis=1)
+             & (codes[:, 30] == 0) & weekday_found & month_found & (hour < 24) & (minute < 60) & (second < 60))
+
+    months = ((year - 1970) * 12 + _MONTH_ORDER[np.minimum(month, 11)]).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1)
+    # Day 0 or past the end of the month rolls into a neighbouring month
+    valid &= (day >= 1) & (days.astype('datetime64[M]') == months)
+    result = (days.astype('datetime64[s]') + (hour * 3600 + minute * 60 + second)).astype('datetime64[ns]')
+
+    for i in np.flatnonzero(~valid):
+        result[i] = np.datetime64(datetime.strptime(values[i], TIMESTAMP_FORMAT), 'ns')
+    return pd.DatetimeIndex(result)
+
+def _batch_frame(columns):
+    with stage('store.parse_created_at', len(columns['created_at'])):
+        created_at = parse_created_at(columns['created_at'])
+    df = pd.DataFrame({
+        'id': pd.Series(columns['id'], dtype='int64'),
+        'created_at': created_at,
+        'full_text': pd.Series(columns['full_text'], dtype=object),
+        'tweet_type': pd.Series(columns['tweet_type'], dtype=object),
+        'hashtags': pd.Series(columns['hashtags'], dtype=object),
+        'user_mentions': pd.Series(columns['user_mentions'], dtype=object),
+        'url_count': pd.Series(columns['url_count'], dtype='int32'),
+    })
+    df['hashtag_count'] = df['hashtags'].str.len().astype('int32')
+    df['mention_count'] = df['user_mentions'].str.len().astype('int32')
+    return df
+
+_COLUMNS = ['id', 'created_at', 'full_text', 'tweet_type', 'hashtags', 'user_mentions', 'url_count']
+
+# Column values of the given tweet entries
+def _parse_columns(tweets):
+    columns = {name: [] for name in _COLUMNS}
+    for tweet in tweets:
+        tweet = tweet['tweet']
+        text = tweet.get('full_text')
+        entities = tweet.get('entities', {})
+        columns['id'].append(int(tweet['id_str']))
+        columns['created_at'].append(tweet['created_at'])
+        columns['full_text'].append(text)
+        columns['tweet_type'].append(tweet_type(text) if text is not None else None)
+        columns['hashtags'].append([tag['text'] for tag in entities.get('hashtags', [])])
+        columns['user_mentions'].append([mention['screen_name'] for mention in entities.get('user_mentions', [])])
+        columns['url_count'].append(len(entities.get('urls', [])))
+    return columns
+
+# Parse one file of the archive into typed columnar frames of up to batch_size tweets
+def ingest_part(input_file, batch_size=100000):
+    tweets = iter_tweets(input_file)
+    while True:
+        with stage('store.parse_json') as record:
+            columns = _parse_columns(islice(tweets, batch_size))
+            record['rows'] = len(columns['id'])
+        if columns['id'] or batch_size is None:
+            yield _batch_frame(columns)
+        if batch_size is None or len(columns['id']) < batch_size:
+            return
+
+def _nonempty(batches):
+    return next((df for df in batches if len(df)), None)
+
+# K-way merge of frame streams that are each newest first (the export's order)
+# into one newest-first stream. Every round emits the rows at or after the
+# oldest timestamp that all streams have reached, so only one frame per stream
+# is held at a time; equal timestamps keep the stream order
+def merge_batches(streams, batch_size=100000):
+    streams = [iter(stream) for stream in streams]
+    heads = [_nonempty(stream) for stream in streams]
+    while any(head is not None for head in heads):
+        watermark = max(head['created_at'].iloc[-1] for head in heads if head is not None)
+        ready = []
+        for i, head in enumerate(heads):
+            if head is None:
+                continue
+            newer = (head['created_at'] >= watermark).to_numpy()
+            ready.append(head[newer])
+            heads[i] = _nonempty(streams[i]) if newer.all() else head[~newer]
+        merged = pd.concat(ready, ignore_index=True).sort_values('created_at', ascending=False, kind='stable', ignore_index=True)
+        for start in range(0, len(merged), batch_size or len(merged)):
+            yield merged.iloc[start:start + batch_size] if batch_size else merged
+
+# The whole archive as frames of up to batch_size tweets; the parts of a
+# multi-part archive are parsed one after the other and merged by timestamp
+def ingest_batches(input_file, batch_size=100000):
+    parts = archive_parts(input_file)
+    if len(parts) == 1:
+        yield from ingest_part(input_file, batch_size)
+    else:
+        yield from merge_batches([ingest_part(part, batch_size) for part in parts], batch_size)
+
+def ingest(input_file):
+    batches = list(ingest_batches(input_file, batch_size=None)) or [next(ingest_part(input_file, batch_size=None))]
+    return batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+
+def is_fresh(input_file):
+    store_file, key_file = store_paths(input_file)
+    if not (os.path.exists(store_file) and os.path.exists(key_file)):
+        return False
+    with open(key_file, 'r', encoding='utf-8') as f:
+        stored = json.load(f)
+    key = archive_key(input_file)
+    if key['size'] != stored['size'] or key.get('parts') != stored.get('parts'):
+        return False
+    if key['mtime_ns'] == stored['mtime_ns']:
+        return True
+    # Same size but touched/copied: fall back to the content hash
+    key = archive_key(input_file, with_hash=True)
+    if key['sha256'] != stored['sha256']:
+        return False
+    with open(key_file, 'w', encoding='utf-8') as f:
+        json.dump(key, f)
+    return True
+
+def _write_part(job):
+    input_file, part_store, batch_size = job
+    with stage('store.parse_part') as record, pq.ParquetWriter(part_store, STORE_SCHEMA) as writer:
+        record['rows'] = 0
+        for df in ingest_part(input_file, batch_size):
+            writer.write_table(pyarrow.Table.from_pandas(df, schema=STORE_SCHEMA, preserve_index=False))
+            record['rows'] += len(df)
+    return part_store
+
+def _read_part(part_store, batch_size):
+    for batch in pq.ParquetFile(part_store).iter_batches(batch_size=batch_size):
+        yield batch.to_pandas()
+
+# Multi-part archives: the parts are parsed in parallel (up to workers
+# processes), each into a temporary Parquet file, then merged by timestamp
+def parallel_part_batches(parts, batch_size=100000, workers=None, temp_dir=None):
+    with tempfile.TemporaryDirectory(dir=temp_dir) as tmp:
+        jobs = [(part, os.path.join(tmp, f'part{i}.parquet'), batch_size) for i, part in enumerate(parts)]
+        workers = min(workers or _settings['part_workers'] or os.cpu_count() or 1, len(jobs))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                part_stores = [collect(part_store) for part_store in pool.map(in_worker(_write_part), jobs)]
+        else:
+            part_stores = [_write_part(job) for job in jobs]
+        yield from merge_batches([_read_part(part_store, batch_size) for part_store in part_stores], batch_size)
+
+# Stream the parsed archive into the Parquet store one row group per batch
+def build_store(input_file, batch_size=100000, workers=None):
+    store_file, key_file = store_paths(input_file)
+    parts = archive_parts(input_file)
+    if len(parts) == 1:
+        batches = ingest_part(input_file, batch_size)
+    else:
+        batches = parallel_part_batches(parts, batch_size, workers, temp_dir=os.path.dirname(store_file) or None)
+    with stage('store.build') as record, pq.ParquetWriter(store_file, STORE_SCHEMA) as writer:
+        record['rows'] = 0
+        for df in batches:
+            with stage('store.write', len(df)):
+                writer.write_table(pyarrow.Table.from_pandas(df, schema=STORE_SCHEMA, preserve_index=False))
+            record['rows'] += len(df)
+    with open(key_file, 'w', encoding='utf-8') as f:
+        json.dump(archive_key(input_file, with_hash=True), f)
+    return store_file
+
+# SHA-256 of the archive the store was built from, rebuilding a stale store;
+# caches derived from the store (cube, index) are keyed by it
+def store_hash(input_file):
+    if not is_fresh(input_file):
+        build_store(input_file)
+    with open(store_paths(input_file)[1], 'r', encoding='utf-8') as f:
+        return json.load(f)['sha256']
+
+# Load the tweet frame from the cached store, rebuilding it when the archive changed
+def load_tweet_frame(input_file, columns=None):
+    if pyarrow is None:
+        df = ingest(input_file)
+        return df if columns is None else df[columns]
+    if not is_fresh(input_file):
+        build_store(input_file)
+    return pd.read_parquet(store_paths(input_file)[0], columns=columns)
+
+# Same as load_tweet_frame, one batch_size slice at a time
+def iter_tweet_batches(input_file, columns=None, batch_size=100000):
+    if pyarrow is None:
+        df = load_tweet_frame(input_file, columns)
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start + batch_size]
+        return
+    if not is_fresh(input_file):
+        build_store(input_file)
+    for batch in pq.ParquetFile(store_paths(input_file)[0]).iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+if __name__ == "__main__":
+    import sys
+    for path in sys.argv[1:]:
+        store_file = build_store(path)
+        print(f"Stored {pq.ParquetFile(store_file).metadata.num_rows} tweets from {path} in {store_file}")
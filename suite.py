@@ -0,0 +1,143 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+import cloud
+import extract
+import feature
+import plot
+import tfidf
+import weekly
+from bench import measure
+from render import CACHE_FILE
+from store import build_store
+from synth import generate
+
+SIZES = [10000, 100000, 1000000, 10000000]
+
+# Stages run the scripts' own entry points on the archive, each in a fresh
+# process (bench.measure) with their console output dropped. 'store' parses
+# the archive; the later stages read that store, like a second run of the scripts
+def _quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+def _fresh_figures(input_file):
+    output_dir = os.path.dirname(input_file)
+    if os.path.exists(os.path.join(output_dir, CACHE_FILE)):
+        os.remove(os.path.join(output_dir, CACHE_FILE))
+    return output_dir
+
+def stage_store(input_file):
+    build_store(input_file)
+
+def stage_extract(input_file):
+    extract.extract_full_text(input_file)
+
+def stage_feature(input_file):
+    df, _ = feature.extract_features(input_file, keep_columns=feature.STATISTICS_COLUMNS)
+    _quiet(feature.print_statistics, df)
+
+def stage_weekly(input_file):
+    output_dir = _fresh_figures(input_file)
+    _quiet(weekly.main, input_file, output_dir)
+
+def stage_plot(input_file):
+    plot.plot_all(input_file, _fresh_figures(input_file))
+
+def stage_tfidf(input_file):
+    _quiet(tfidf.main, input_file, os.path.join(os.path.dirname(input_file), 'tfidf.json'))
+
+def stage_tfidf_hashing(input_file):
+    _quiet(tfidf.main, input_file, os.path.join(os.path.dirname(input_file), 'tfidf.json'), hashing=True)
+
+def stage_cloud(input_file):
+    _quiet(cloud.run, input_file, output_dir=_fresh_figures(input_file))
+
+STAGES = {
+    'store': stage_store,
+    'extract': stage_extract,
+    'feature': stage_feature,
+    'weekly': stage_weekly,
+    'plot': stage_plot,
+    'tfidf': stage_tfidf,
+    'tfidf-hashing': stage_tfidf_hashing,
+    'cloud': stage_cloud,
+}
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpu_count': os.cpu_count(), 'commit': commit}
+
+# Generate (or reuse) a synthetic archive per size and time every stage on it.
+# The results file is rewritten after each stage, so a run that dies at 10M
+# still keeps the smaller sizes
+def run_suite(work_dir, sizes=SIZES, stages=list(STAGES), output_file=None, synth_options=None):
+    output_file = output_file or os.path.join(work_dir, 'bench_results.json')
+    results = {'started': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'machine': machine_info(), 'runs': []}
+    for size in sizes:
+        input_file = os.path.join(work_dir, f'tweets_{size}', 'tweets.js')
+        if not os.path.exists(input_file):
+            os.makedirs(os.path.dirname(input_file), exist_ok=True)
+            print(f"Generating {size} tweets in {input_file}")
+            generate(input_file, tweets=size, **(synth_options or {}))
+        archive_mb = os.path.getsize(input_file) / 2**20
+        for stage in stages:
+            run = {'stage': stage, 'tweets': size, 'archive_mb': round(archive_mb, 1)}
+            try:
+                r = measure(STAGES[stage], input_file)
+                run.update(seconds=round(r['seconds'], 3), peak_rss_mb=round(r['peak_rss_mb'], 1),
+                           tweets_per_sec=round(size / r['seconds'], 1))
+                print(f"{stage:<14} {size:>9} {r['seconds']:9.2f}s {size / r['seconds']:12.0f} tweets/s  peak RSS {r['peak_rss_mb']:.0f} MB")
+            except Exception as e:  # a stage running out of memory must not end the suite
+                run['error'] = f'{type(e).__name__}: {e}'
+                print(f"{stage:<14} {size:>9} failed: {run['error']}")
+            results['runs'].append(run)
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    return results, output_file
+
+# Stage/size pairs slower (or with a higher peak RSS) than in the baseline results by more than tolerance
+def regressions(results, baseline, tolerance=0.25):
+    previous = {(run['stage'], run['tweets']): run for run in baseline['runs'] if 'error' not in run}
+    found = []
+    for run in results['runs']:
+        old = previous.get((run['stage'], run['tweets']))
+        if old is None:
+            continue
+        if 'error' in run:
+            found.append(f"{run['stage']} at {run['tweets']} tweets failed: {run['error']}")
+            continue
+        for key in ['seconds', 'peak_rss_mb']:
+            if run[key] > old[key] * (1 + tolerance):
+                found.append(f"{run['stage']} at {run['tweets']} tweets: {key} {old[key]} -> {run[key]}")
+    return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time every stage on synthetic archives of each size')
+    parser.add_argument('work_dir', help='directory for the generated archives, outputs and results')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--output', help='results file (default: work_dir/bench_results.json)')
+    parser.add_argument('--baseline', help='earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown/RSS growth over the baseline')
+    parser.add_argument('--japanese', type=float, default=0.5, help='share of Japanese tweets in the archives')
+    args = parser.parse_args()
+
+    results, output_file = run_suite(args.work_dir, args.sizes, args.stages, args.output, {'japanese': args.japanese})
+    print(f"Results saved to {output_file}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,132 @@
+import argparse
+import json
+from datetime import datetime, timedelta
+import numpy as np
+from loader import part_file
+
+ENGLISH = ('the a to of and in is for on it you that this with my be at just are have so not but '
+           'data market python stock analysis trading model risk AI Tokyo today tomorrow news chart '
+           'price rate yen dollar bank fund invest economy growth report learning code research great '
+           'time day week good new year people think know work really love need').split()
+JAPANESE = ('株価 分析 投資 今日 明日 市場 円安 日経 決算 金利 銘柄 相場 経済 データ 学習 研究 '
+            'ニュース 仕事 時間 東京 本当 最近 予想 上昇 下落 注目 確認 発表 結果 会社').split()
+USERS = [f'user{i}' for i in range(200)]
+HASHTAGS = ['Python', 'AI', '投資', '株式', 'データ分析', 'Tokyo', 'trading', '日経平均', 'MachineLearning', 'economy']
+SOURCE = '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>'
+
+# Zipf-like word choice over the fixed words plus a tail of rare synthetic terms
+def vocabulary(words, size, prefix):
+    vocab = words + [f'{prefix}{i}' for i in range(max(size - len(words), 0))]
+    cdf = np.cumsum(1 / np.arange(1, len(vocab) + 1))
+    return vocab, cdf / cdf[-1]
+
+def _sentences(rng, vocab, cdf, japanese):
+    sentences = []
+    for _ in range(rng.integers(1, 4)):
+        words = [vocab[i] for i in np.minimum(cdf.searchsorted(rng.random(rng.integers(2, 12))), len(vocab) - 1)]
+        if japanese:
+            sentences.append(''.join(words) + '。')
+        else:
+            sentences.append(' '.join(words) + str(rng.choice(['.', '!', '?', ''])))
+    return ('' if japanese else ' ').join(sentences)
+
+def _indices(start, token):
+    return [str(start), str(start + len(token))]
+
+# One archive entry in the layout of the Twitter export's tweets.js
+def make_tweet(rng, index, created_at, options, english, japanese):
+    japanese_text = rng.random() < options['japanese']
+    body = _sentences(rng, *(japanese if japanese_text else english), japanese_text)
+    kind = rng.random()
+    user = USERS[rng.integers(len(USERS))]
+    mentions, hashtags, urls = [], [], []
+    if kind < options['retweets']:
+        text = f'RT @{user}: {body}'
+        mentions.append((user, _indices(3, '@' + user)))
+    elif kind < options['retweets'] + options['replies']:
+        text = f'@{user} {body}'
+        mentions.append((user, _indices(0, '@' + user)))
+    else:
+        text = body
+    if rng.random() < 0.1:
+        name = USERS[rng.integers(len(USERS))]
+        mentions.append((name, _indices(len(text) + 1, '@' + name)))
+        text += f' @{name}'
+    if rng.random() < 0.3:
+        for i in rng.choice(len(HASHTAGS), size=rng.integers(1, 3), replace=False):
+            hashtags.append((HASHTAGS[i], _indices(len(text) + 1, '#' + HASHTAGS[i])))
+            text += f' #{HASHTAGS[i]}'
+    if rng.random() < 0.3:
+        url = f'https://t.co/{index:010x}'
+        urls.append((url, _indices(len(text) + 1, url)))
+        text += f' {url}'
+
+    tweet_id = str(1000000000000000000 + index)
+    tweet = {
+        'edit_info': {'initial': {'editTweetIds': [tweet_id], 'editableUntil': '', 'editsRemaining': '5', 'isEditEligible': True}},
+        'retweeted': False,
+        'source': SOURCE,
+        'entities': {
+            'hashtags': [{'text': tag, 'indices': indices} for tag, indices in hashtags],
+            'symbols': [],
+            'user_mentions': [{'name': name, 'screen_name': name, 'indices': indices,
+                               'id_str': str(USERS.index(name) + 1000), 'id': str(USERS.index(name) + 1000)} for name, indices in mentions],
+            'urls': [{'url': url, 'expanded_url': f'https://example.com/{index}', 'display_url': f'example.com/{index}',
+                      'indices': indices} for url, indices in urls],
+        },
+        'display_text_range': ['0', str(len(text))],
+        'favorite_count': str(rng.integers(0, 50)),
+        'id_str': tweet_id,
+        'truncated': False,
+        'retweet_count': '0',
+        'id': tweet_id,
+        'created_at': created_at.strftime('%a %b %d %H:%M:%S +0000 %Y'),
+        'favorited': False,
+        'full_text': text,
+        'lang': 'ja' if japanese_text else 'en',
+    }
+    if options['retweets'] <= kind < options['retweets'] + options['replies']:
+        tweet['in_reply_to_screen_name'] = user
+        tweet['in_reply_to_user_id_str'] = str(USERS.index(user) + 1000)
+    return {'tweet': tweet}
+
+# Write an archive of n tweets, newest first like the export, streaming so the
+# size is not limited by memory; parts > 1 splits it into tweets.js,
+# tweets-part1.js, ... as large exports are
+def generate(output_file, tweets=10000, retweets=0.2, replies=0.2, japanese=0.5, vocabulary_size=20000,
+             days=730, end='2024-09-19', seed=0, indent=None, parts=1):
+    rng = np.random.default_rng(seed)
+    options = {'retweets': retweets, 'replies': replies, 'japanese': japanese}
+    english, japanese_words = vocabulary(ENGLISH, vocabulary_size // 2, 'term'), vocabulary(JAPANESE, vocabulary_size // 2, '語')
+    end = datetime.strptime(end, '%Y-%m-%d')
+    offsets = np.sort(rng.integers(0, days * 86400, tweets))
+    bounds = np.linspace(0, tweets, parts + 1).astype(int)
+    for part in range(parts):
+        with open(part_file(output_file, part), 'w', encoding='utf-8') as f:
+            f.write(f'window.YTD.tweets.part{part} = [')
+            for i in range(bounds[part], bounds[part + 1]):
+                tweet = make_tweet(rng, tweets - i, end - timedelta(seconds=int(offsets[i])), options, english, japanese_words)
+                f.write((', ' if i > bounds[part] else ' ') + json.dumps(tweet, ensure_ascii=False, indent=indent))
+            f.write(' ]')
+    return output_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a synthetic tweets.js archive')
+    parser.add_argument('output_file')
+    parser.add_argument('--tweets', type=int, default=10000)
+    parser.add_argument('--retweets', type=float, default=0.2, help='share of retweets')
+    parser.add_argument('--replies', type=float, default=0.2, help='share of replies (the rest are originals)')
+    parser.add_argument('--japanese', type=float, default=0.5, help='share of Japanese tweets (the rest are English)')
+    parser.add_argument('--vocabulary', type=int, default=20000, help='distinct words to draw from')
+    parser.add_argument('--days', type=int, default=730, help='days covered by the archive')
+    parser.add_argument('--end', default='2024-09-19', help='date of the newest tweet')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--indent', type=int, help='JSON indent (the export uses 2; slower to write)')
+    parser.add_argument('--parts', type=int, default=1, help='files to split the archive into (tweets-part1.js, ...)')
+    args = parser.parse_args()
+    if args.retweets + args.replies > 1:
+        parser.error('--retweets and --replies add up to more than 1')
+
+    generate(args.output_file, args.tweets, args.retweets, args.replies, args.japanese, args.vocabulary,
+             args.days, args.end, args.seed, args.indent, args.parts)
+    print(f"Wrote {args.tweets} tweets to {args.output_file}")
@@ -1,31 +1,123 @@
+import argparse
 import json
+import os
 import re
 from collections import Counter
-from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+import instrument
+from instrument import stage
+from store import iter_tweet_batches, load_tweet_frame
+
+TOP_K = 30
+NOISE = re.compile(r'@\w+|http\S+|\bRT\b|[^a-zA-Z\s]')
+
+# The top_k words by summed TF-IDF over the texts, best first
+def top_tfidf_words(texts, top_k=TOP_K):
+    vectorizer = TfidfVectorizer(max_features=top_k, stop_words='english')
+    tfidf_matrix = vectorizer.fit_transform(texts)
+    return sorted(zip(vectorizer.get_feature_names_out(), tfidf_matrix.sum(axis=0).tolist()[0]), key=lambda x: x[1], reverse=True)
 
 def analyze_tweets(tweets):
-    texts = [re.sub(r'@\w+|http\S+|\bRT\b|[^a-zA-Z\s]', '', tweet['full_text']).lower().split() for tweet in tweets]
+    with stage('tfidf.clean', len(tweets)):
+        texts = [NOISE.sub('', text).lower().split() for text in tweets['full_text']]
     
-    vectorizer = TfidfVectorizer(max_features=30, stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform([' '.join(text) for text in texts])
+    with stage('tfidf.fit', len(texts)):
+        top_words = top_tfidf_words([' '.join(text) for text in texts])
     
     return {
         'total_tweets': len(tweets),
         'avg_tweet_length': sum(len(text) for text in texts) / len(tweets),
-        'top_words': sorted(zip(vectorizer.get_feature_names_out(), tfidf_matrix.sum(axis=0).tolist()[0]), key=lambda x: x[1], reverse=True),
-        'top_hashtags': Counter([tag['text'] for tweet in tweets for tag in tweet.get('entities', {}).get('hashtags', [])]).most_common(30),
-        'top_mentioned_users': Counter([mention['screen_name'] for tweet in tweets for mention in tweet.get('entities', {}).get('user_mentions', [])]).most_common(30)
+        'top_words': top_words,
+        'top_hashtags': Counter([tag for tags in tweets['hashtags'] for tag in tags]).most_common(30),
+        'top_mentioned_users': Counter([name for names in tweets['user_mentions'] for name in names]).most_common(30)
     }
 
-def main(input_file, output_file):
-    with open(input_file, 'r', encoding='utf-8') as f:
-        tweets = json.loads(f.read().replace('window.YTD.tweets.part0 = ', ''))
+def _text_batches(input_file, columns, batch_size):
+    for tweets in iter_tweet_batches(input_file, columns=['full_text'] + columns, batch_size=batch_size):
+        yield tweets[tweets['full_text'].notna()]
+
+# Out-of-core variant of analyze_tweets: two passes over the store through a
+# HashingVectorizer, so memory is set by n_features and batch_size instead of
+# the vocabulary. Pass one sums term and document frequencies per hash bucket
+# and keeps the TOP_K buckets by term frequency (TfidfVectorizer's max_features
+# rule); pass two computes their smoothed-idf, L2-normalized tf-idf and names
+# each bucket after the token hashed into it. Apart from hash collisions and
+# ties at rank TOP_K, the top words match analyze_tweets up to float rounding
+def analyze_tweets_hashed(input_file, n_features=2**20, batch_size=100000):
+    vectorizer = HashingVectorizer(n_features=n_features, stop_words='english', alternate_sign=False, norm=None)
+    analyzer = vectorizer.build_analyzer()
+    term_freq = np.zeros(n_features)
+    doc_freq = np.zeros(n_features, dtype=np.int64)
+    total_tweets, total_words = 0, 0
+    hashtags, mentions = Counter(), Counter()
+    
+    for tweets in _text_batches(input_file, ['hashtags', 'user_mentions'], batch_size):
+        with stage('tfidf.term_counts', len(tweets)):
+            texts = [NOISE.sub('', text).lower() for text in tweets['full_text']]
+            counts = vectorizer.transform(texts)
+            term_freq += np.asarray(counts.sum(axis=0)).ravel()
+            doc_freq += np.bincount(counts.indices, minlength=n_features)
+            total_tweets += len(texts)
+            total_words += sum(len(text.split()) for text in texts)
+            hashtags.update(tag for tags in tweets['hashtags'] for tag in tags)
+            mentions.update(name for names in tweets['user_mentions'] for name in names)
+    
+    top = np.flatnonzero(term_freq)
+    if len(top) > TOP_K:
+        top = top[np.argpartition(-term_freq[top], TOP_K - 1)[:TOP_K]]
+    idf = np.log((1 + total_tweets) / (1 + doc_freq[top])) + 1
+    scores = np.zeros(len(top))
+    names, wanted = {}, set(top.tolist())
+    
+    for tweets in _text_batches(input_file, [], batch_size):
+        with stage('tfidf.scores', len(tweets)):
+            texts = [NOISE.sub('', text).lower() for text in tweets['full_text']]
+            tfidf = vectorizer.transform(texts)[:, top].multiply(idf).tocsr()
+            norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+            norms[norms == 0] = 1
+            scores += np.asarray(tfidf.multiply(1 / norms[:, None]).sum(axis=0)).ravel()
+        # Name each bucket after a token hashed into it, from the first tweets containing it
+        for row in np.unique(tfidf.nonzero()[0]) if len(names) < len(wanted) else []:
+            tokens = analyzer(texts[row])
+            for token, column in zip(tokens, vectorizer.transform(tokens).indices.tolist()):
+                if column in wanted:
+                    names.setdefault(column, token)
+            if len(names) == len(wanted):
+                break
+    
+    top_words = sorted(zip((names[column] for column in top.tolist()), scores.tolist()))
+    return {
+        'total_tweets': total_tweets,
+        'avg_tweet_length': total_words / total_tweets,
+        'top_words': sorted(top_words, key=lambda x: x[1], reverse=True),
+        'top_hashtags': hashtags.most_common(TOP_K),
+        'top_mentioned_users': mentions.most_common(TOP_K)
+    }
+
+def main(input_file, output_file, hashing=False, batch_size=100000):
+    if hashing:
+        results = analyze_tweets_hashed(input_file, batch_size=batch_size)
+    else:
+        tweets = load_tweet_frame(input_file, columns=['full_text', 'hashtags', 'user_mentions'])
+        results = analyze_tweets(tweets[tweets['full_text'].notna()])
     
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(analyze_tweets([tweet['tweet'] for tweet in tweets]), f, ensure_ascii=False, indent=2)
+        json.dump(results, f, ensure_ascii=False, indent=2)
     
     print(f"Analysis results saved to {output_file}")
 
 if __name__ == "__main__":
-    main(r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js',
-         r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tfidf.json')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', nargs='?',
+                        default=r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js')
+    parser.add_argument('output_file', nargs='?', help='default: tfidf.json next to input_file')
+    parser.add_argument('--hashing', action='store_true', help='out-of-core mode: hashed terms, two passes over the store')
+    parser.add_argument('--batch-size', type=int, default=100000, help='tweets per batch in --hashing mode')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.configure_from_args(args)
+
+    output_file = args.output_file or os.path.join(os.path.dirname(args.input_file), 'tfidf.json')
+    main(args.input_file, output_file, hashing=args.hashing, batch_size=args.batch_size)
+    instrument.report()
@@ -1,31 +1,31 @@
-import json
+import argparse
 import os
 import re
-from datetime import datetime
 import pandas as pd
 import matplotlib.pyplot as plt
+import instrument
+from cube import load_cube, period_counts
+from incremental import diff_ids, load_state, save_state, state_path, update_buckets
+from render import render_figures
+from store import load_tweet_frame
 
 # Load tweets from a file
 def load_tweets(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.loads(f.read().replace('window.YTD.tweets.part0 = ', ''))
+    return load_tweet_frame(file_path, columns=['id', 'created_at', 'tweet_type'])
 
 # Clean tweet text
 def clean_text(text):
     return re.sub(r'http\S+|\s+', ' ', text).strip()
 
-# Format timestamp
-def format_timestamp(timestamp_str):
-    return datetime.strptime(timestamp_str, '%a %b %d %H:%M:%S +0000 %Y')
-
 # Process tweets into a DataFrame
 def process_tweets(tweets):
-    df = pd.DataFrame([{
-        'created_at': format_timestamp(tweet['tweet']['created_at']),
-        'is_original': not tweet['tweet']['full_text'].startswith(('RT @', '@')),
-        'is_retweet': tweet['tweet']['full_text'].startswith('RT @'),
-        'is_reply': tweet['tweet']['full_text'].startswith('@')
-    } for tweet in tweets if 'full_text' in tweet['tweet']])
+    tweets = tweets[tweets['tweet_type'].notna()]
+    df = pd.DataFrame({
+        'created_at': tweets['created_at'],
+        'is_original': tweets['tweet_type'] == 'original',
+        'is_retweet': tweets['tweet_type'] == 'retweet',
+        'is_reply': tweets['tweet_type'] == 'reply'
+    }).reset_index(drop=True)
     return df
 
 # Analyze tweets on a weekly basis
@@ -42,8 +42,44 @@ def monthly_analysis(df):
     df['total_tweets'] = df.sum(axis=1)
     return df
 
+# Weekly and monthly stats rolled up from the archive's count cube instead of
+# resampling every tweet; same result as weekly_analysis/monthly_analysis
+def cube_analysis(input_file):
+    cube = load_cube(input_file)
+    stats = []
+    with instrument.stage('weekly.rollup', len(cube)):
+        for freq in ['W', 'M']:
+            df = period_counts(cube, freq)
+            df['total_tweets'] = df.sum(axis=1)
+            stats.append(df)
+    return stats
+
+# Update the weekly and monthly buckets saved by the previous run with only the
+# tweets added to or deleted from the archive since then
+def incremental_analysis(tweets, input_file):
+    tweets = tweets[tweets['tweet_type'].notna()].reset_index(drop=True)
+    seen_file = state_path(input_file, 'weekly_seen')
+    seen = load_state(seen_file)
+    if seen is None:
+        seen = tweets.iloc[:0]
+    new, removed = diff_ids(tweets['id'], seen['id'])
+    added, gone = process_tweets(tweets[new]), process_tweets(seen[removed])
+    
+    stats = []
+    for name, freq in [('weekly', 'W'), ('monthly', 'M')]:
+        buckets_file = state_path(input_file, f'{name}_buckets')
+        buckets = load_state(buckets_file)
+        if buckets is None:
+            buckets = process_tweets(tweets.iloc[:0]).set_index('created_at')
+        buckets = update_buckets(buckets, added, gone, tweets['created_at'], freq)
+        save_state(buckets, buckets_file)
+        buckets['total_tweets'] = buckets.sum(axis=1)
+        stats.append(buckets)
+    save_state(tweets[['id', 'created_at', 'tweet_type']], seen_file)
+    return stats
+
 # Plot stacked bar chart with custom axis labels
-def plot_stats(df, output_dir, title, filename, freq='W'):
+def draw_stats(df, path, title, freq='W'):
     # Plotting
     ax = df[['is_original', 'is_retweet', 'is_reply']].plot(
         kind='bar', 
@@ -70,36 +106,48 @@ def plot_stats(df, output_dir, title, filename, freq='W'):
     ax.legend(['Original', 'Retweet', 'Reply'], loc='upper right')
 
     # Save the plot to a file
-    output_image_file = os.path.join(output_dir, filename)
     plt.tight_layout()
-    plt.savefig(output_image_file)
-    print(f"Plot saved to {output_image_file}")
+    plt.savefig(path)
     plt.close()
 
+def plot_stats(df, output_dir, title, filename, freq='W'):
+    output_image_file = os.path.join(output_dir, filename)
+    draw_stats(df, output_image_file, title, freq)
+    print(f"Plot saved to {output_image_file}")
+
 # Main function
-def main(input_file, output_dir):
-    tweets = load_tweets(input_file)
-    df = process_tweets(tweets)
+def main(input_file, output_dir, incremental=False, workers=None):
+    if incremental:
+        weekly_stats, monthly_stats = incremental_analysis(load_tweets(input_file), input_file)
+    else:
+        weekly_stats, monthly_stats = cube_analysis(input_file)
     
     # Weekly analysis
-    weekly_stats = weekly_analysis(df)
     output_weekly_file = os.path.join(output_dir, 'weekly_twitter_stats.csv')
     weekly_stats.to_csv(output_weekly_file)
     print(f"Weekly statistics saved to {output_weekly_file}")
     
-    # Plot weekly stats
-    plot_stats(weekly_stats, output_dir, 'Weekly Tweet Activity', 'weekly_tweet_activity.png', freq='W')
-    
     # Monthly analysis
-    monthly_stats = monthly_analysis(df)
     output_monthly_file = os.path.join(output_dir, 'monthly_twitter_stats.csv')
     monthly_stats.to_csv(output_monthly_file)
     print(f"Monthly statistics saved to {output_monthly_file}")
     
-    # Plot monthly stats
-    plot_stats(monthly_stats, output_dir, 'Monthly Tweet Activity', 'monthly_tweet_activity.png', freq='M')
+    # Plot weekly and monthly stats in parallel, skipping unchanged ones
+    rendered = render_figures([
+        ('weekly_tweet_activity.png', draw_stats, weekly_stats, {'title': 'Weekly Tweet Activity', 'freq': 'W'}),
+        ('monthly_tweet_activity.png', draw_stats, monthly_stats, {'title': 'Monthly Tweet Activity', 'freq': 'M'}),
+    ], output_dir, workers=workers)
+    for output_image_file in rendered:
+        print(f"Plot saved to {output_image_file}")
 
 if __name__ == "__main__":
-    input_file = r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js'
-    output_dir = os.path.dirname(input_file)
-    main(input_file, output_dir)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', nargs='?',
+                        default=r'C:\Users\100ca\Downloads\twitter-2024-09-19-741b09a4d07b6875e14faaed1104872c99f2c1d9574872876fd3d2342d11756c\data\tweets.js')
+    parser.add_argument('--incremental', action='store_true', help='only process tweets not seen by the previous run')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.configure_from_args(args)
+    output_dir = os.path.dirname(args.input_file)
+    main(args.input_file, output_dir, incremental=args.incremental)
+    instrument.report()